@@ -0,0 +1,217 @@
+# Pandas - Основная функциональность
+#
+# Готовые планы переиндексации для многократного использования.
+#
+# В ex02-01 reindex вызывается для одного объекта. Если на один и тот же
+# торговый календарь переиндексируются десятки тысяч Series с одинаковым
+# индексом, каждый вызов reindex заново сопоставляет метки: для каждой
+# метки нового индекса ищется её позиция в старом.
+#
+# Класс ReindexPlan выполняет это сопоставление (get_indexer) один раз для
+# пары (старый индекс, новый индекс). Применение плана - один вызов take
+# по готовым позициям и заполнение отсутствующих меток. Планы хранятся в
+# кэше PlanCache с ключом по идентичности (id) обоих индексов и вытеснением
+# давно не использованных (LRU). План держит ссылки на свои индексы, поэтому
+# пока план в кэше, эти объекты не удаляются и их id не может достаться
+# другим индексам.
+import collections
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class ReindexPlan:
+    def __init__(self, source, target, method=None):
+        if not source.is_unique:
+            raise ValueError("cannot reindex on an axis with duplicate labels")
+        self.source = source
+        self.target = pd.Index(target)
+        self.method = method
+        self.indexer = source.get_indexer(self.target, method=method)
+        indexer = self.indexer
+        self.mask = indexer < 0
+        self.missing = self.mask.any()
+        # На месте отсутствующих меток берётся любая позиция, а затем
+        # значение заменяется на заполнитель:
+        self.positions = np.where(self.mask, 0, indexer) if self.missing \
+            else indexer
+
+    # Переиндексация массива значений по оси 0.
+    def take(self, values, fill_value=np.nan):
+        if not self.missing:
+            return values.take(self.positions, axis=0)
+        if not len(values):
+            result = np.empty((len(self.positions),) + values.shape[1:],
+                              dtype=_promote(values.dtype, fill_value))
+        else:
+            result = values.take(self.positions, axis=0)
+            result = result.astype(_promote(values.dtype, fill_value),
+                                   copy=False)
+        if result.dtype.kind in 'mM' and pd.isna(fill_value):
+            fill_value = np.array('NaT', dtype=result.dtype)
+        result[self.mask] = fill_value
+        return result
+
+    # Переиндексация столбца или ряда (obj.array). Массивы с типами
+    # pandas (category, Int64, str) переносятся своим методом take, чтобы
+    # тип сохранился, как в reindex.
+    def take_array(self, array, fill_value=np.nan):
+        if isinstance(array.dtype, np.dtype):
+            return self.take(array.to_numpy(), fill_value)
+        return array.take(self.indexer, allow_fill=True,
+                          fill_value=None if pd.isna(fill_value)
+                          else fill_value)
+
+    # Результат obj.reindex(target) (axis=0) или
+    # frame.reindex(columns=target) (axis='columns').
+    def apply(self, obj, axis=0, fill_value=np.nan):
+        if isinstance(obj, pd.Series):
+            return pd.Series(self.take_array(obj.array, fill_value),
+                             index=self.target, name=obj.name, copy=False)
+        if axis in (1, 'columns'):
+            columns = {}
+            for j, i in enumerate(self.positions):
+                if self.mask[j]:
+                    columns[j] = np.full(len(obj), fill_value)
+                else:
+                    columns[j] = obj.iloc[:, i].array
+            result = pd.DataFrame(columns, index=obj.index)
+            result.columns = self.target
+            return result
+        result = pd.DataFrame({j: self.take_array(obj.iloc[:, j].array,
+                                                  fill_value)
+                               for j in range(obj.shape[1])},
+                              index=self.target)
+        result.columns = obj.columns
+        return result
+
+
+# Тип результата после вставки fill_value, как в reindex: целые числа с
+# NaN становятся float64, логические значения - объектами.
+def _promote(dtype, fill_value):
+    if dtype.kind == 'b' and not isinstance(fill_value, (bool, np.bool_)):
+        return np.dtype(object)
+    if dtype.kind in 'iuf':
+        return np.result_type(dtype, fill_value)
+    return dtype
+
+
+class PlanCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.plans = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Кэшируются только планы для target типа pd.Index: индекс неизменяем,
+    # а список по тому же id мог быть изменён после прошлого вызова.
+    def get(self, source, target, method=None):
+        if not isinstance(target, pd.Index):
+            self.misses += 1
+            return ReindexPlan(source, target, method)
+        key = id(source), id(target), method
+        plan = self.plans.get(key)
+        if plan is not None and plan.source is source and plan.key is target:
+            self.plans.move_to_end(key)
+            self.hits += 1
+            return plan
+        self.misses += 1
+        plan = ReindexPlan(source, target, method)
+        # Ссылка на сам target (plan.target может быть его копией)
+        # сохраняет его id:
+        plan.key = target
+        self.plans[key] = plan
+        if len(self.plans) > self.maxsize:
+            self.plans.popitem(last=False)
+        return plan
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'plans': len(self.plans)}
+
+
+_cache = PlanCache()
+
+
+# Замена obj.reindex(target, method=method) с использованием кэша планов.
+def reindex(obj, target, method=None, axis=0, fill_value=np.nan,
+            cache=_cache):
+    source = obj.columns if axis in (1, 'columns') else obj.index
+    return cache.get(source, target, method).apply(obj, axis, fill_value)
+
+
+def main():
+    # Series и DataFrame из ex02-01:
+    obj = pd.Series([4.5, 7.2, -5.3, 3.6], index=['d', 'b', 'a', 'c'])
+    target = pd.Index(['a', 'b', 'c', 'd', 'e'])
+    print(reindex(obj, target))
+    # a   -5.3
+    # b    7.2
+    # c    3.6
+    # d    4.5
+    # e    NaN
+    # dtype: float64
+
+    obj3 = pd.Series(['blue', 'purple', 'yellow'], index=[0, 2, 4])
+    print(reindex(obj3, range(6), method='ffill').equals(
+        obj3.reindex(range(6), method='ffill')))
+    # True
+
+    frame = pd.DataFrame(
+        np.arange(9).reshape((3, 3)),
+        index=['a', 'c', 'd'],
+        columns=['Ohio', 'Texas', 'California']
+    )
+    states = ['Texas', 'Utah', 'California']
+    print(reindex(frame, ['a', 'b', 'c', 'd']).equals(
+        frame.reindex(['a', 'b', 'c', 'd'])),
+        reindex(frame, states, axis='columns').equals(
+        frame.reindex(columns=states)))
+    # True True
+
+    separator()
+
+    # 10000 рядов с одним индексом из 1500 торговых дней переиндексируются
+    # на полный календарь из 2000 дней. Ряды создаются с общим объектом
+    # индекса (у столбцов data[column] индекс - новый объект-копия, и ключ
+    # по id для них не совпадёт):
+    rng = np.random.default_rng(0)
+    calendar = pd.bdate_range('2015-01-01', periods=2000)
+    dates = calendar[np.sort(rng.choice(len(calendar), 1500,
+                                        replace=False))]
+    values = rng.normal(0, 1, (10_000, 1500))
+    series = [pd.Series(row, index=dates) for row in values]
+
+    start = time.perf_counter()
+    expected = [s.reindex(calendar) for s in series]
+    print(f"Series.reindex: {time.perf_counter() - start:6.3f} с")
+    cache = PlanCache()
+    start = time.perf_counter()
+    result = [reindex(s, calendar, cache=cache) for s in series]
+    print(f"ReindexPlan:    {time.perf_counter() - start:6.3f} с")
+    print(all(a.equals(b) for a, b in zip(result, expected)), cache.info())
+    # Series.reindex:  2.072 с
+    # ReindexPlan:     0.826 с
+    # True {'hits': 9999, 'misses': 1, 'plans': 1}
+
+    # Оставшееся время ReindexPlan - в основном take и создание объектов
+    # Series.
+
+
+if __name__ == '__main__':
+    main()
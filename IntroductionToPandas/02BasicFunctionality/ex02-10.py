@@ -0,0 +1,182 @@
+# Pandas - Основная функциональность
+#
+# Ленивая переиндексация: значения создаются только при обращении.
+#
+# frame.reindex(columns=['Texas', 'Utah', 'California']) из ex02-01 сразу
+# создаёт новую таблицу: копирует все столбцы и заполняет NaN столбец
+# Utah, которого в frame нет. Если дальше используются только несколько
+# столбцов, почти вся эта работа и память не нужны.
+#
+# Класс LazyReindex запоминает только сопоставление меток - планы
+# ReindexPlan из ex02-08 для строк и для столбцов. Значения столбца
+# создаются при обращении к нему, и только для выбранных строк. Столбец,
+# которого нет в исходной таблице, - виртуальный: пока к нему не
+# обратились, он не занимает памяти, а при обращении создаётся как
+# столбец NaN. Возвращаемые Series и DataFrame, как и результат reindex,
+# можно изменять - они не связаны с исходной таблицей.
+import importlib
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class LazyReindex:
+    def __init__(self, frame, index=None, columns=None):
+        plans = importlib.import_module('ex02-08')
+        self.frame = frame
+        # Сопоставление строк; None - строки frame без изменений:
+        self.rows = None if index is None \
+            else plans.ReindexPlan(frame.index, index)
+        self.index = frame.index if self.rows is None else self.rows.target
+        self.plan = plans.ReindexPlan(frame.columns, frame.columns
+                                      if columns is None else columns)
+        self.columns = self.plan.target
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.columns)
+
+    # Значения столбца с номером j результата - новый изменяемый массив,
+    # как в результате reindex. Столбец берётся как obj.array, чтобы типы
+    # pandas (category, Int64) сохранились; без переиндексации строк он
+    # копируется.
+    def _values(self, j):
+        if self.plan.mask[j]:
+            return np.full(len(self.index), np.nan)
+        array = self.frame.iloc[:, self.plan.positions[j]].array
+        return array.copy() if self.rows is None \
+            else self.rows.take_array(array)
+
+    # view['Utah'] - Series, view[['Texas', 'Utah']] - DataFrame.
+    def __getitem__(self, key):
+        if isinstance(key, list):
+            positions = self.columns.get_indexer(key)
+            if (positions < 0).any():
+                raise KeyError(list(np.asarray(key)[positions < 0]))
+            frame = pd.DataFrame({k: self._values(j)
+                                  for k, j in enumerate(positions)},
+                                 index=self.index, copy=False)
+            frame.columns = self.columns[positions]
+            return frame
+        j = self.columns.get_loc(key)
+        return pd.Series(self._values(j), index=self.index, name=key,
+                         copy=False)
+
+    # Ленивое представление для части строк (срез позиций), например
+    # view.slice(0, 5) вместо reindexed.iloc[0:5].
+    def slice(self, start=None, stop=None):
+        view = LazyReindex.__new__(LazyReindex)
+        view.__dict__.update(self.__dict__)
+        if self.rows is None:
+            view.frame = self.frame.iloc[start:stop]
+            view.index = view.frame.index
+        else:
+            view.rows = _slice_plan(self.rows, slice(start, stop))
+            view.index = view.rows.target
+        return view
+
+    # Вся таблица, как frame.reindex(index, columns=columns).
+    def to_frame(self):
+        return self[list(self.columns)]
+
+
+# План ReindexPlan для части строк: тот же план со срезом позиций.
+def _slice_plan(plan, key):
+    part = object.__new__(type(plan))
+    part.__dict__.update(plan.__dict__)
+    part.target = plan.target[key]
+    part.indexer = plan.indexer[key]
+    part.positions = plan.positions[key]
+    part.mask = plan.mask[key]
+    part.missing = part.mask.any()
+    return part
+
+
+def main():
+    # Таблица из ex02-01:
+    frame = pd.DataFrame(
+        np.arange(9).reshape((3, 3)),
+        index=['a', 'c', 'd'],
+        columns=['Ohio', 'Texas', 'California']
+    )
+    states = ['Texas', 'Utah', 'California']
+    view = LazyReindex(frame, columns=states)
+    print(view.shape)
+    # (3, 3)
+
+    print(view['Utah'])
+    # a   NaN
+    # c   NaN
+    # d   NaN
+    # Name: Utah, dtype: float64
+
+    print(view.to_frame().equals(frame.reindex(columns=states)))
+    # True
+
+    view = LazyReindex(frame, index=['a', 'b', 'c', 'd'], columns=states)
+    print(view[['Texas', 'Utah']])
+    #    Texas  Utah
+    # a    1.0   NaN
+    # b    NaN   NaN
+    # c    4.0   NaN
+    # d    7.0   NaN
+
+    print(view.slice(1, 3).to_frame().equals(
+        frame.reindex(['a', 'b', 'c', 'd'], columns=states).iloc[1:3]))
+    # True
+
+    separator()
+
+    # Таблица из 100000 строк и 1000 столбцов переиндексируется на новые
+    # строки (10% меток новые) и 1000 столбцов (100 из них новые), после
+    # чего используются 10 столбцов (5 из них новые):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.normal(0, 1, (100_000, 1000)),
+                        columns=[f"c{i:04d}" for i in range(1000)])
+    index = np.sort(rng.choice(110_000, 100_000, replace=False))
+    columns = [f"c{i:04d}" for i in range(100, 1100)]
+    used = [f"c{i:04d}" for i in range(1000, 1100, 20)] + \
+        [f"c{i:04d}" for i in range(100, 1000, 180)]
+
+    def eager():
+        return data.reindex(index, columns=columns)[used].sum()
+
+    def lazy():
+        return LazyReindex(data, index, columns)[used].sum()
+
+    for title, func in [('reindex:    ', eager), ('LazyReindex:', lazy)]:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{title} {elapsed:6.3f} с, пик {peak / 2 ** 20:7.1f} МБ")
+    print(result.equals(eager()))
+    # reindex:      0.644 с, пик   770.6 МБ
+    # LazyReindex:  0.020 с, пик    10.2 МБ
+    # True
+
+    # LazyReindex создаёт только 10 использованных столбцов для 110000
+    # строк (по 0.8 МБ), а не всю таблицу из 1000 столбцов.
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# Pandas - Основная функциональность
+#
+# Удаление записей без копирования: метки удалённых записей.
+#
+# obj.drop('c'), data.drop(['Colorado', 'Ohio']) и
+# data.drop(['two', 'four'], axis='columns') из ex02-02 создают новый
+# объект: строят новый индекс и копируют все оставшиеся значения. Так же
+# работает и obj.drop('c', inplace=True) - копия просто заменяет данные
+# объекта. Если из таблицы в 50 миллионов строк каждую секунду удаляются
+# несколько сотен меток, каждое удаление копирует всю таблицу.
+#
+# Класс TombstoneFrame при удалении только отмечает строки или столбцы как
+# удалённые в массивах-масках (O(k) для k меток: позиции ищутся по
+# хэш-таблице индекса, которая строится один раз). Чтение пропускает
+# удалённые записи. Когда доля удалённых строк или столбцов превышает
+# compact_at, таблица уплотняется - один раз копируются живые записи.
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class TombstoneFrame:
+    def __init__(self, data, compact_at=0.25):
+        self.data = data
+        self.compact_at = compact_at
+        self.compactions = 0
+        self._reset()
+
+    def _reset(self):
+        self.alive = np.ones(len(self.data), dtype=bool)
+        self.dead = 0
+        if isinstance(self.data, pd.DataFrame):
+            self.column_alive = np.ones(self.data.shape[1], dtype=bool)
+            self.dead_columns = 0
+
+    # Аналог data.drop(labels, axis=axis, inplace=True): удалённые метки
+    # только отмечаются.
+    def drop(self, labels, axis=0, errors='raise'):
+        columns = axis in (1, 'columns')
+        axis_index = self.data.columns if columns else self.data.index
+        alive = self.column_alive if columns else self.alive
+        if not pd.api.types.is_list_like(labels):
+            labels = [labels]
+        # Уже удалённые метки считаются отсутствующими:
+        if axis_index.is_unique:
+            positions = axis_index.get_indexer(labels)
+            found = positions >= 0
+            found[found] = alive[positions[found]]
+            positions = positions[found]
+        else:
+            # Метка с повторами найдена, если жива хотя бы одна её запись:
+            matched = axis_index.isin(labels) & alive
+            found = pd.Index(labels).isin(axis_index[matched])
+            positions = np.flatnonzero(matched)
+        if errors == 'raise' and not found.all():
+            missing = np.asarray(labels, dtype=object)[~found]
+            raise KeyError(f"{list(missing)} not found in axis")
+        positions = np.unique(positions)
+        alive[positions] = False
+        if columns:
+            self.dead_columns += len(positions)
+        else:
+            self.dead += len(positions)
+        if self.dead > self.compact_at * len(self.alive) or (
+                columns and self.dead_columns
+                > self.compact_at * len(self.column_alive)):
+            self.compact()
+
+    # Копирует живые записи и сбрасывает маски.
+    def compact(self):
+        rows = slice(None) if not self.dead else self.alive
+        if isinstance(self.data, pd.Series):
+            self.data = self.data[rows]
+        else:
+            columns = slice(None) if not self.dead_columns \
+                else self.column_alive
+            self.data = self.data.iloc[rows, columns]
+        self.compactions += 1
+        self._reset()
+
+    def __len__(self):
+        return len(self.alive) - self.dead
+
+    @property
+    def index(self):
+        return self.data.index[self.alive] if self.dead else self.data.index
+
+    @property
+    def columns(self):
+        return self.data.columns[self.column_alive] if self.dead_columns \
+            else self.data.columns
+
+    # Строка или значение по метке: O(1), без копирования таблицы. Для
+    # метки с повторами, как data.loc[label], - живые записи с этой меткой.
+    def get(self, label):
+        position = _alive_positions(self.data.index, self.alive, label)
+        if isinstance(self.data, pd.Series):
+            return self.data.iloc[position]
+        return self.data.iloc[position, self.column_alive]
+
+    # Столбец без удалённых строк; для метки с повторами, как data[column],
+    # - таблица из живых столбцов с этой меткой.
+    def __getitem__(self, column):
+        position = _alive_positions(self.data.columns, self.column_alive,
+                                    column)
+        values = self.data.iloc[:, position]
+        return values[self.alive] if self.dead else values
+
+    # Живые записи как обычный объект pandas (копия).
+    def to_pandas(self):
+        rows = self.alive if self.dead else slice(None)
+        if isinstance(self.data, pd.Series):
+            return self.data[rows]
+        return self.data.iloc[rows, self.column_alive if self.dead_columns
+                              else slice(None)]
+
+
+# Позиция метки label в индексе axis_index (для метки с повторами - массив
+# позиций) среди живых записей по маске alive; KeyError, если живых нет.
+def _alive_positions(axis_index, alive, label):
+    position = axis_index.get_loc(label)
+    if isinstance(position, (slice, np.ndarray)):
+        position = np.arange(len(alive))[position]
+        position = position[alive[position]]
+        if not len(position):
+            raise KeyError(label)
+    elif not alive[position]:
+        raise KeyError(label)
+    return position
+
+
+def main():
+    # Series и DataFrame из ex02-02:
+    obj = TombstoneFrame(pd.Series(np.arange(5.),
+                                   index=['a', 'b', 'c', 'd', 'e']))
+    obj.drop('c')
+    obj.drop(['d'])
+    print(obj.to_pandas())
+    # a    0.0
+    # b    1.0
+    # e    4.0
+    # dtype: float64
+
+    try:
+        obj.get('c')
+    except KeyError as error:
+        print('KeyError:', error)
+    # KeyError: 'c'
+
+    data = pd.DataFrame(np.arange(16).reshape((4, 4)),
+                        index=['Ohio', 'Colorado', 'Utah', 'New Your'],
+                        columns=['one', 'two', 'three', 'four'])
+    frame = TombstoneFrame(data, compact_at=0.5)
+    frame.drop(['Colorado', 'Ohio'])
+    frame.drop(['two', 'four'], axis='columns')
+    print(frame.to_pandas())
+    #           one  three
+    # Utah        8     10
+    # New Your   12     14
+
+    print(frame.to_pandas().equals(data.drop(['Colorado', 'Ohio'])
+                                   .drop(['two', 'four'], axis='columns')),
+          frame.compactions, frame.data.shape)
+    # True 0 (4, 4)
+
+    # Удалено больше половины строк - таблица уплотняется:
+    frame.drop('Utah')
+    print(frame.compactions, frame.data.shape)
+    # 1 (1, 2)
+
+    separator()
+
+    # Цикл вытеснения: 100 раз удаляется по 300 случайных меток из таблицы
+    # в 10 миллионов строк:
+    rng = np.random.default_rng(0)
+    n = 10_000_000
+    data = pd.DataFrame(rng.normal(0, 1, (n, 4)),
+                        index=rng.permutation(n) * 7,
+                        columns=['bid', 'ask', 'bid_size', 'ask_size'])
+    batches = np.split(rng.choice(data.index.to_numpy(), 30_000,
+                                  replace=False), 100)
+
+    eager = data
+    start = time.perf_counter()
+    for batch in batches[:5]:
+        eager = eager.drop(batch)
+    elapsed = (time.perf_counter() - start) / 5
+    print(f"DataFrame.drop:      {elapsed * 1e3:8.3f} мс на удаление")
+
+    # Хэш-таблица индекса строится при первом поиске метки; в долго
+    # работающем цикле она уже построена:
+    frame = TombstoneFrame(data)
+    frame.index.get_loc(0)
+    start = time.perf_counter()
+    for batch in batches:
+        frame.drop(batch)
+    elapsed = (time.perf_counter() - start) / len(batches)
+    print(f"TombstoneFrame.drop: {elapsed * 1e3:8.3f} мс на удаление")
+
+    eager = eager.drop(np.concatenate(batches[5:]))
+    print(frame.to_pandas().equals(eager), len(frame), frame.compactions)
+
+    # Уплотнение - одна копия живых записей:
+    start = time.perf_counter()
+    frame.compact()
+    print(f"TombstoneFrame.compact: {time.perf_counter() - start:6.3f} с")
+    # DataFrame.drop:      2127.229 мс на удаление
+    # TombstoneFrame.drop:    0.127 мс на удаление
+    # True 9970000 0
+    # TombstoneFrame.compact:  0.282 с
+
+    # Большая часть времени drop - построение хэш-таблицы нового индекса:
+    # после каждого удаления индекс новый, и поиск меток в нём начинается
+    # с её построения. Уплотнение копирует только данные.
+
+
+if __name__ == '__main__':
+    main()
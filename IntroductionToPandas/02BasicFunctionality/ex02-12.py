@@ -0,0 +1,242 @@
+# Pandas - Основная функциональность
+#
+# Кэш выравнивания для повторяющихся арифметических операций.
+#
+# При сложении s1 + s2 и df1 + df2 из ex02-03 pandas выравнивает объекты:
+# строит объединение индексов и два массива позиций, по которым значения
+# каждого объекта переносятся на объединённый индекс. Если одни и те же
+# пары индексов складываются миллионы раз, выравнивание каждый раз
+# выполняется заново.
+#
+# Класс AlignmentCache хранит для пары индексов (ключ - id левого и
+# правого индекса) объединённый индекс и оба массива позиций
+# (Index.join(how='outer', return_indexers=True), как в pandas). Функция
+# arith после этого сразу вызывает векторную операцию NumPy. Быстрые пути:
+#   - один и тот же объект индекса - выравнивание не нужно;
+#   - равные индексы (Index.equals) - тоже не нужно, результат проверки
+#     запоминается.
+# Кэш ограничен по памяти (индексы и массивы позиций) и вытесняет давно
+# не использованные пары (LRU). Записи держат ссылки на свои индексы,
+# поэтому id этих индексов не может достаться другим объектам.
+import collections
+import operator
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class AlignmentCache:
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Объединённый индекс и позиции левого и правого объекта в нём;
+    # None вместо позиций - значения берутся как есть.
+    def align(self, left, right):
+        if left is right:
+            return left, None, None
+        key = id(left), id(right)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is left and entry[1] is right:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2:5]
+        self.misses += 1
+        if left.equals(right):
+            joined, lidx, ridx = left, None, None
+        else:
+            joined, lidx, ridx = left.join(right, how='outer',
+                                           return_indexers=True)
+        size = sum(x.nbytes for x in (lidx, ridx) if x is not None)
+        if joined is not left:
+            size += joined.memory_usage()
+        self.entries[key] = left, right, joined, lidx, ridx, size
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.nbytes -= self.entries.popitem(last=False)[1][5]
+        return joined, lidx, ridx
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries), 'nbytes': self.nbytes}
+
+
+# Перенос значений по позициям indexer вдоль оси axis; позиции -1
+# заполняются NaN (целые числа приводятся к float64). В логический массив
+# NaN вставить нельзя - для таких объектов нужны операторы pandas.
+def _take(values, indexer, axis):
+    if indexer is None:
+        return values
+    result = values.take(indexer, axis=axis)
+    missing = indexer < 0
+    if missing.any():
+        if result.dtype.kind == 'b':
+            raise TypeError("cannot align bool values with missing labels, "
+                            "use pandas operators")
+        if result.dtype.kind in 'iu':
+            result = result.astype(np.float64)
+        if axis == 0:
+            result[missing] = np.nan
+        else:
+            result[:, missing] = np.nan
+    return result
+
+
+# Значения столбца j результата: столбец cols[j] объекта frame,
+# перенесённый по позициям rows; столбца нет в frame - NaN.
+def _column(frame, cols, j, rows, length):
+    i = j if cols is None else cols[j]
+    if i < 0:
+        return np.full(length, np.nan)
+    return _take(frame.iloc[:, i].to_numpy(), rows, 0)
+
+
+def _combine(lvalues, rvalues, op, fill_value):
+    if fill_value is not None:
+        lmissing, rmissing = pd.isna(lvalues), pd.isna(rvalues)
+        if lmissing.any() or rmissing.any():
+            lvalues = np.where(lmissing & ~rmissing, fill_value, lvalues)
+            rvalues = np.where(rmissing & ~lmissing, fill_value, rvalues)
+    with np.errstate(all='ignore'):
+        return op(lvalues, rvalues)
+
+
+_cache = AlignmentCache()
+
+
+# Результат op(left, right) для двух Series или двух DataFrame (например,
+# arith(s1, s2, operator.add) вместо s1 + s2). С fill_value значение,
+# отсутствующее только в одном из объектов, заменяется на fill_value,
+# как в df1.add(df2, fill_value=0). Поддерживаются числовые и логические
+# типы NumPy. Таблица, все столбцы которой одного типа, обрабатывается как
+# один двумерный массив; столбцы разных типов обрабатываются по одному,
+# чтобы тип каждого столбца результата был таким же, как в pandas.
+def arith(left, right, op, fill_value=None, cache=_cache):
+    for dtype in _dtypes(left) + _dtypes(right):
+        if not isinstance(dtype, np.dtype) or dtype.kind not in 'iufb':
+            raise TypeError(f"arith supports numeric and bool dtypes, "
+                            f"got {dtype}")
+    index, lrows, rrows = cache.align(left.index, right.index)
+    if isinstance(left, pd.Series):
+        result = _combine(_take(left.to_numpy(), lrows, 0),
+                          _take(right.to_numpy(), rrows, 0), op, fill_value)
+        name = left.name if left.name == right.name else None
+        return pd.Series(result, index=index, name=name, copy=False)
+
+    columns, lcols, rcols = cache.align(left.columns, right.columns)
+    if len(set(left.dtypes)) <= 1 and len(set(right.dtypes)) <= 1:
+        lvalues = _take(_take(left.to_numpy(), lrows, 0), lcols, 1)
+        rvalues = _take(_take(right.to_numpy(), rrows, 0), rcols, 1)
+        return pd.DataFrame(_combine(lvalues, rvalues, op, fill_value),
+                            index=index, columns=columns, copy=False)
+    result = pd.DataFrame({
+        j: _combine(_column(left, lcols, j, lrows, len(index)),
+                    _column(right, rcols, j, rrows, len(index)),
+                    op, fill_value)
+        for j in range(len(columns))}, index=index)
+    result.columns = columns
+    return result
+
+
+def _dtypes(obj):
+    return [obj.dtype] if isinstance(obj, pd.Series) else list(obj.dtypes)
+
+
+def main():
+    # Series и DataFrame из ex02-03:
+    s1 = pd.Series([7.3, -2.5, 3.4, 1.5], index=['a', 'c', 'd', 'e'])
+    s2 = pd.Series([-2.1, 3.6, -1.5, 4, 3.1], index=['a', 'c', 'e', 'f', 'g'])
+    cache = AlignmentCache()
+    print(arith(s1, s2, operator.add, cache=cache))
+    # a    5.2
+    # c    1.1
+    # d    NaN
+    # e    0.0
+    # f    NaN
+    # g    NaN
+    # dtype: float64
+
+    df1 = pd.DataFrame(np.arange(9.).reshape((3, 3)),
+                       columns=list('bcd'),
+                       index=['Ohio', 'Texas', 'Colorado'])
+    df2 = pd.DataFrame(np.arange(12.).reshape((4, 3)),
+                       columns=list('bde'),
+                       index=['Utah', 'Ohio', 'Texas', 'Oregon'])
+    print(arith(df1, df2, operator.add, cache=cache).equals(df1 + df2),
+          arith(df1, df2, operator.add, 0, cache).equals(
+              df1.add(df2, fill_value=0)))
+    # True True
+
+    print(arith(s1, s2, operator.add, cache=cache).equals(s1 + s2),
+          cache.info())
+    # True {'hits': 3, 'misses': 3, 'entries': 3, 'nbytes': 360}
+
+    separator()
+
+    # Одна и та же пара рядов из 10000 меток (половина общих) складывается
+    # 1000 раз:
+    rng = np.random.default_rng(0)
+    labels = pd.date_range('2000-01-01', periods=15_000, freq='h')
+    left = pd.Series(rng.normal(0, 1, 10_000), index=labels[:10_000])
+    right = pd.Series(rng.normal(0, 1, 10_000), index=labels[5000:][
+        rng.permutation(10_000)])
+    cache = AlignmentCache()
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        expected = left + right
+    print(f"left + right:  {time.perf_counter() - start:6.3f} с")
+    start = time.perf_counter()
+    for _ in range(1000):
+        result = arith(left, right, operator.add, cache=cache)
+    print(f"arith:         {time.perf_counter() - start:6.3f} с")
+    print(result.equals(expected), cache.info())
+    # left + right:   3.066 с
+    # arith:          0.181 с
+    # True {'hits': 999, 'misses': 1, 'entries': 1, 'nbytes': 360000}
+
+    # То же для таблиц 1000 x 50 с разными строками и столбцами:
+    df1 = pd.DataFrame(rng.normal(0, 1, (1000, 50)),
+                       index=rng.permutation(1200)[:1000],
+                       columns=[f"c{i}" for i in range(50)])
+    df2 = pd.DataFrame(rng.normal(0, 1, (1000, 50)),
+                       index=rng.permutation(1200)[:1000],
+                       columns=[f"c{i}" for i in range(10, 60)])
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        expected = df1 * df2
+    print(f"df1 * df2:     {time.perf_counter() - start:6.3f} с")
+    start = time.perf_counter()
+    for _ in range(1000):
+        result = arith(df1, df2, operator.mul, cache=cache)
+    print(f"arith:         {time.perf_counter() - start:6.3f} с")
+    print(result.equals(expected), cache.info())
+    # df1 * df2:      2.260 с
+    # arith:          1.235 с
+    # True {'hits': 2997, 'misses': 3, 'entries': 3, 'nbytes': 389520}
+
+    # Для таблиц выигрыш меньше: значительную часть времени занимает
+    # перенос значений по позициям (take) и заполнение NaN.
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Pandas - Описательная и сводная статистика
+#
+# Вычисление describe() за один проход по каждому столбцу.
+#
+# В ex03-01 метод describe возвращает count, mean, std, min, квартили и
+# max. Для этого pandas несколько раз просматривает каждый столбец
+# (отдельно для count, mean, std, min, max) и ещё раз сортирует или
+# разбивает его для квантилей. На больших таблицах это дорого: каждый
+# проход читает весь столбец из памяти.
+#
+# Функция fused_describe читает столбец блоками по block строк, которые
+# помещаются в кэш процессора, и по каждому блоку сразу получает число
+# значений, сумму, сумму квадратов отклонений от среднего блока, минимум и
+# максимум. Итоги блоков объединяются формулой Чана (как в ex04-06).
+# Значения без пропусков по ходу копируются в буфер, и все квантили
+# находятся одним вызовом np.partition. Столбцы обрабатываются параллельно
+# в пуле потоков: NumPy отпускает GIL на время вычислений.
+import concurrent.futures
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Статистика одного столбца: count, mean, std, min, квантили, max.
+def describe_column(values, percentiles, block=65536):
+    values = np.asarray(values, dtype=np.float64)
+    buffer = np.empty_like(values)
+    count, mean, m2 = 0, 0.0, 0.0
+    low, high = np.inf, -np.inf
+    for start in range(0, len(values), block):
+        x = values[start:start + block]
+        mask = ~np.isnan(x)
+        if not mask.all():
+            x = x[mask]
+        n = len(x)
+        if n == 0:
+            continue
+        buffer[count:count + n] = x
+        block_mean = x.sum() / n
+        d = x - block_mean
+        block_m2 = d @ d
+        delta = block_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += block_m2 + delta * delta * count * n / total
+        count = total
+        low = min(low, x.min())
+        high = max(high, x.max())
+
+    result = np.full(len(percentiles) + 5, np.nan)
+    result[0] = count
+    if count == 0:
+        return result
+    result[1] = mean
+    if count > 1:
+        result[2] = np.sqrt(m2 / (count - 1))
+    result[3] = low
+    result[-1] = high
+    # Линейная интерполяция между соседними порядковыми статистиками, как
+    # в Series.quantile:
+    position = np.asarray(percentiles) * (count - 1)
+    below = np.floor(position).astype(np.intp)
+    above = np.ceil(position).astype(np.intp)
+    data = buffer[:count]
+    data.partition(np.unique(np.concatenate([below, above])))
+    result[4:-1] = data[below] + (data[above] - data[below]) * \
+        (position - below)
+    return result
+
+
+# Аналог DataFrame.describe() для числовых столбцов. percentiles - как в
+# describe в pandas 3 (медиана не добавляется, если её нет в списке),
+# block - число строк в блоке, max_workers - число потоков.
+def fused_describe(frame, percentiles=(0.25, 0.5, 0.75), block=65536,
+                   max_workers=None):
+    frame = frame.select_dtypes('number')
+    percentiles = np.unique(np.asarray(percentiles, dtype=np.float64))
+    index = ['count', 'mean', 'std', 'min'] + \
+        [f"{p * 100:g}%" for p in percentiles] + ['max']
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        results = list(pool.map(
+            lambda column: describe_column(frame[column].to_numpy(),
+                                           percentiles, block),
+            frame.columns))
+    return pd.DataFrame(np.column_stack(results) if results else
+                        np.empty((len(index), 0)),
+                        index=index, columns=frame.columns)
+
+
+def main():
+    # Таблица из ex03-01:
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    print(fused_describe(df))
+    #             one       two
+    # count  3.000000  2.000000
+    # mean   3.083333 -2.900000
+    # std    3.493685  2.262742
+    # min    0.750000 -4.500000
+    # 25%    1.075000 -3.700000
+    # 50%    1.400000 -2.900000
+    # 75%    4.250000 -2.100000
+    # max    7.100000 -1.300000
+
+    separator()
+
+    # Другие процентили, как в describe(percentiles=[...]):
+    print(fused_describe(df, percentiles=[0.1, 0.9]))
+    #             one       two
+    # count  3.000000  2.000000
+    # mean   3.083333 -2.900000
+    # std    3.493685  2.262742
+    # min    0.750000 -4.500000
+    # 10%    0.880000 -4.180000
+    # 90%    5.960000 -1.620000
+    # max    7.100000 -1.300000
+
+    separator()
+
+    # Сравним скорость на таблице из 10 миллионов строк и 8 столбцов
+    # (640 МБ) с пропусками:
+    rng = np.random.default_rng(0)
+    values = rng.normal(100, 15, (10_000_000, 8))
+    values[rng.random(values.shape) < 0.01] = np.nan
+    big = pd.DataFrame(values, columns=[f"c{i}" for i in range(8)])
+    del values
+
+    start = time.perf_counter()
+    expected = big.describe()
+    print(f"describe():        {time.perf_counter() - start:6.2f} с")
+    for workers in [1, 4]:
+        start = time.perf_counter()
+        result = fused_describe(big, max_workers=workers)
+        print(f"fused_describe({workers}): "
+              f"{time.perf_counter() - start:6.2f} с")
+    print(np.allclose(result, expected, rtol=1e-12, atol=0))
+    # describe():          6.75 с
+    # fused_describe(1):   2.88 с
+    # fused_describe(4):   2.91 с
+    # True
+
+    # На машине с одним ядром потоки не ускоряют расчёт; на многоядерной
+    # машине время уменьшается почти пропорционально числу потоков, пока
+    # их не больше числа столбцов.
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+# Pandas - Описательная и сводная статистика
+#
+# Приближённые квантили для describe() с помощью объединяемых эскизов.
+#
+# Строки 25%, 50% и 75% в выводе describe() (ex03-01) - точные порядковые
+# статистики: чтобы их найти, нужен весь столбец в памяти и его частичная
+# сортировка (см. ex03-02). Если данные читаются по частям или разделены
+# между процессами, точные квантили так не получить.
+#
+# Эскиз KLL (Karnin, Lang, Liberty) хранит небольшую выборку значений,
+# разложенную по уровням: значение на уровне h заменяет 2**h исходных.
+# Когда уровень переполняется, его значения сортируются и на следующий
+# уровень переходит каждое второе из них (чётные или нечётные - выбирается
+# случайно). Размер эскиза - O(k·log(n/k)) значений, а ошибка ранга
+# квантиля (доля значений, на которую ошибается найденная позиция)
+# примерно равна 2.446 / k**0.9433: около 1.65% при k=200 и 0.36% при
+# k=1000. Два эскиза объединяются сложением уровней, поэтому части одной
+# таблицы можно обрабатывать отдельно, а затем объединить их эскизы.
+import concurrent.futures
+import importlib
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class KLLSketch:
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    # Ожидаемая ошибка ранга (эмпирическая формула из библиотеки
+    # Apache DataSketches).
+    @property
+    def rank_error(self):
+        return 2.446 / self.k ** 0.9433
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for h, items in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        # Значение с рангом r - первое, накопленный вес которого больше r.
+        # Между соседними рангами значения интерполируются линейно, как в
+        # Series.quantile; пока эскиз хранит все значения, результат
+        # совпадает с точным.
+        position = np.clip(q, 0, 1) * (self.n - 1)
+        below, above = [
+            items[np.minimum(np.searchsorted(cumulative, rank, side='right'),
+                             len(items) - 1)]
+            for rank in [np.floor(position), np.ceil(position)]]
+        result = below + (above - below) * (position - np.floor(position))
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+
+    # Число хранимых значений.
+    def __len__(self):
+        return sum(len(items) for items in self.levels)
+
+    def _capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(8, int(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) < self._capacity(h):
+                h += 1
+                continue
+            items = np.sort(self.levels[h])
+            # При нечётном числе значений одно остаётся на своём уровне:
+            keep = len(items) % 2
+            offset = self.rng.integers(2)
+            promoted = items[keep + offset::2]
+            self.levels[h] = items[:keep]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1],
+                                                 promoted])
+            # После появления нового уровня ёмкость нижних уменьшается,
+            # поэтому проверка начинается сначала:
+            h = 0
+
+
+# Сводная статистика по частям таблицы: count, mean и std вычисляются
+# точно (формула Чана, как в ex03-02), квантили - по эскизам KLL.
+class SketchSummary:
+    def __init__(self, columns, k=200, seed=None):
+        self.columns = pd.Index(columns)
+        n = len(self.columns)
+        seeds = np.random.SeedSequence(seed).spawn(n)
+        self.sketches = [KLLSketch(k, s) for s in seeds]
+        self.count = np.zeros(n)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+
+    def update(self, frame):
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        mask = ~np.isnan(values)
+        count = mask.sum(axis=0)
+        with np.errstate(invalid='ignore'):
+            mean = np.where(mask, values, 0).sum(axis=0) / count
+        d = np.where(mask, values - mean, 0)
+        self._combine(count, np.nan_to_num(mean), (d * d).sum(axis=0))
+        for sketch, column in zip(self.sketches, values.T):
+            sketch.update(column)
+        return self
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+        for sketch, sketch_other in zip(self.sketches, other.sketches):
+            sketch.merge(sketch_other)
+        return self
+
+    def describe(self, percentiles=(0.25, 0.5, 0.75)):
+        percentiles = np.unique(np.asarray(percentiles, dtype=np.float64))
+        index = ['count', 'mean', 'std', 'min'] + \
+            [f"{p * 100:g}%" for p in percentiles] + ['max']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(self.m2 / (self.count - 1))
+        std[self.count < 2] = np.nan
+        mean = np.where(self.count > 0, self.mean, np.nan)
+        rows = [self.count, mean, std,
+                [s.min if s.n else np.nan for s in self.sketches]]
+        rows += list(np.column_stack([s.quantile(percentiles)
+                                      for s in self.sketches]))
+        rows.append([s.max if s.n else np.nan for s in self.sketches])
+        return pd.DataFrame(rows, index=index, columns=self.columns)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / total,
+                                 0)
+            self.m2 = self.m2 + m2 + np.where(
+                total > 0, delta * delta * self.count * count / total, 0)
+        self.count = total
+
+
+# describe() для числовых столбцов. По умолчанию квантили точные
+# (fused_describe из ex03-02); при approx=True - приближённые, с ошибкой
+# ранга около 2.446 / k**0.9433. chunksize - число строк в части таблицы,
+# которая обрабатывается за один раз.
+def describe(frame, percentiles=(0.25, 0.5, 0.75), approx=False, k=200,
+             chunksize=1_000_000, seed=None):
+    if not approx:
+        fused = importlib.import_module('ex03-02')
+        return fused.fused_describe(frame, percentiles)
+    frame = frame.select_dtypes('number')
+    summary = SketchSummary(frame.columns, k, seed)
+    for start in range(0, len(frame), chunksize):
+        summary.update(frame.iloc[start:start + chunksize])
+    return summary.describe(percentiles)
+
+
+# Эскиз одной части данных; выполняется в отдельном процессе.
+def summarize_part(args):
+    seed, size, k = args
+    rng = np.random.default_rng(seed)
+    part = pd.DataFrame({'x': rng.lognormal(0, 1, size),
+                         'y': rng.normal(0, 1, size)})
+    return SketchSummary(part.columns, k, seed).update(part)
+
+
+def main():
+    # Таблица из ex03-01. Пока данных меньше k, эскиз хранит все значения,
+    # и результат совпадает с describe():
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    print(describe(df, approx=True))
+    #             one       two
+    # count  3.000000  2.000000
+    # mean   3.083333 -2.900000
+    # std    3.493685  2.262742
+    # min    0.750000 -4.500000
+    # 25%    1.075000 -3.700000
+    # 50%    1.400000 -2.900000
+    # 75%    4.250000 -2.100000
+    # max    7.100000 -1.300000
+
+    separator()
+
+    # 10 миллионов значений с пропусками, по частям в миллион строк:
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(0, 1, 10_000_000)
+    values[rng.random(len(values)) < 0.01] = np.nan
+    big = pd.DataFrame({'x': values})
+
+    start = time.perf_counter()
+    expected = describe(big)
+    print(f"точно:   {time.perf_counter() - start:5.2f} с")
+    data = np.sort(values[~np.isnan(values)])
+    for k in [200, 1000]:
+        start = time.perf_counter()
+        result = describe(big, approx=True, k=k, seed=0)
+        elapsed = time.perf_counter() - start
+        # Ошибка ранга: доля значений, на которую позиция найденного
+        # квантиля отличается от заданной.
+        approx = result.loc[['25%', '50%', '75%'], 'x'].to_numpy()
+        error = np.abs(np.searchsorted(data, approx) / len(data) -
+                       np.array([0.25, 0.5, 0.75])).max()
+        print(f"k={k:<5} {elapsed:5.2f} с, ошибка ранга {error:.4%} "
+              f"(ожидается не больше {KLLSketch(k).rank_error:.2%})")
+
+    # точно:    0.41 с
+    # k=200    0.51 с, ошибка ранга 0.4054% (ожидается не больше 1.65%)
+    # k=1000   0.44 с, ошибка ранга 0.0347% (ожидается не больше 0.36%)
+
+    # По времени эскиз не выигрывает у точного расчёта в памяти; его
+    # преимущество в том, что он не требует держать столбец целиком.
+
+    print(pd.concat({'exact': expected['x'],
+                     'approx': result['x']}, axis=1))
+    #               exact        approx
+    # count  9.899918e+06  9.899918e+06
+    # mean   1.647606e+00  1.647606e+00
+    # std    2.159407e+00  2.159407e+00
+    # min    4.747647e-03  4.747647e-03
+    # 25%    5.094707e-01  5.100461e-01
+    # 50%    9.991261e-01  9.991685e-01
+    # 75%    1.961679e+00  1.961439e+00
+    # max    2.047351e+02  2.047351e+02
+
+    separator()
+
+    # Эскизы частей, вычисленные в разных процессах, объединяются в один.
+    # В родительский процесс передаются только эскизы - порядка k
+    # значений на столбец, а не сами данные:
+    parts = [(seed, 1_000_000, 200) for seed in range(4)]
+    with concurrent.futures.ProcessPoolExecutor(2) as pool:
+        summaries = list(pool.map(summarize_part, parts))
+    summary = summaries[0]
+    for other in summaries[1:]:
+        summary.merge(other)
+    print(summary.describe())
+    #                   x             y
+    # count  4.000000e+06  4.000000e+06
+    # mean   1.649636e+00  1.655749e-04
+    # std    2.170933e+00  9.993624e-01
+    # min    3.642544e-03 -5.350106e+00
+    # 25%    5.138863e-01 -6.608812e-01
+    # 50%    9.964055e-01  4.334850e-04
+    # 75%    1.970720e+00  6.850606e-01
+    # max    2.690028e+02  4.998160e+00
+
+    print([len(sketch) for sketch in summary.sketches])
+    # [130, 130]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+# Pandas - Описательная и сводная статистика
+#
+# Накопление моментов по частям таблицы: sum, mean, var, std, skew, kurt.
+#
+# Методы из таблицы 6 в ex03-01 (sum, mean, var, std, skew, kurt) требуют,
+# чтобы вся таблица находилась в памяти, и каждый раз просматривают её
+# заново. Все они выражаются через пять чисел для каждого столбца:
+#   count   - число значений без пропусков;
+#   average - среднее;
+#   m2, m3, m4 - суммы 2-й, 3-й и 4-й степеней отклонений от среднего.
+# Класс Moments вычисляет эти числа для каждой части таблицы и объединяет
+# их формулами Пебэя (обобщение формулы Чана из ex03-02 на высшие
+# моменты). Объединение точное, поэтому части можно обрабатывать в разных
+# процессах, а затем объединить результаты в любом порядке.
+import concurrent.futures
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class Moments:
+    def __init__(self, columns):
+        self.columns = pd.Index(columns)
+        n = len(self.columns)
+        self.count = np.zeros(n)
+        self.total = np.zeros(n)
+        self.average = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.m3 = np.zeros(n)
+        self.m4 = np.zeros(n)
+        # Были ли в столбце пропуски (для skipna=False):
+        self.has_nan = np.zeros(n, dtype=bool)
+
+    def update(self, frame):
+        values = frame[self.columns].to_numpy(dtype=np.float64)
+        mask = ~np.isnan(values)
+        count = mask.sum(axis=0).astype(np.float64)
+        x = np.where(mask, values, 0)
+        total = x.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, total / count, 0)
+        d = np.where(mask, values - mean, 0)
+        d2 = d * d
+        self._combine(count, total, mean, d2.sum(axis=0),
+                      (d2 * d).sum(axis=0), (d2 * d2).sum(axis=0),
+                      ~mask.all(axis=0))
+        return self
+
+    def merge(self, other):
+        self._combine(other.count, other.total, other.average, other.m2,
+                      other.m3, other.m4, other.has_nan)
+        return self
+
+    def sum(self, skipna=True, min_count=0):
+        result = np.where(self.count >= min_count, self.total, np.nan)
+        return self._result(result, skipna)
+
+    def mean(self, skipna=True):
+        return self._result(np.where(self.count > 0, self.average, np.nan),
+                            skipna)
+
+    def var(self, skipna=True, ddof=1):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = self.m2 / (self.count - ddof)
+        result[self.count <= ddof] = np.nan
+        return self._result(result, skipna)
+
+    def std(self, skipna=True, ddof=1):
+        return np.sqrt(self.var(skipna, ddof))
+
+    # Несмещённая асимметрия, та же формула, что в pandas (nanops.nanskew).
+    def skew(self, skipna=True):
+        n, m2, m3 = self.count, self.m2, self.m3
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = n * (n - 1) ** 0.5 / (n - 2) * (m3 / m2 ** 1.5)
+        result[m2 == 0] = 0
+        result[n < 3] = np.nan
+        return self._result(result, skipna)
+
+    # Несмещённый эксцесс, та же формула, что в pandas (nanops.nankurt).
+    def kurt(self, skipna=True):
+        n, m2, m4 = self.count, self.m2, self.m4
+        with np.errstate(divide='ignore', invalid='ignore'):
+            adj = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+            result = n * (n + 1) * (n - 1) * m4 / \
+                ((n - 2) * (n - 3) * m2 * m2) - adj
+        result[m2 == 0] = 0
+        result[n < 4] = np.nan
+        return self._result(result, skipna)
+
+    def _result(self, values, skipna):
+        if not skipna:
+            values = np.where(self.has_nan, np.nan, values)
+        return pd.Series(values, index=self.columns)
+
+    def _combine(self, nb, total, mean, m2, m3, m4, has_nan):
+        na = self.count
+        n = na + nb
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.where(n > 0, mean - self.average, 0)
+            a = np.where(n > 0, na / n, 0)
+            b = np.where(n > 0, nb / n, 0)
+            self.m4 = self.m4 + m4 + delta ** 4 * na * b * (a * a - a * b +
+                                                            b * b) + \
+                6 * delta ** 2 * (a * a * m2 + b * b * self.m2) + \
+                4 * delta * (a * m3 - b * self.m3)
+            self.m3 = self.m3 + m3 + delta ** 3 * na * b * (a - b) + \
+                3 * delta * (a * m2 - b * self.m2)
+            self.m2 = self.m2 + m2 + delta * delta * na * b
+            self.average = self.average + delta * b
+        self.count = n
+        self.total = self.total + total
+        self.has_nan = self.has_nan | has_nan
+
+
+# Статистика по частям таблицы. func - имя метода (sum, mean, var, std,
+# skew, kurt), axis - как у методов DataFrame: при axis=0 результат
+# накапливается по частям, при axis='columns' каждая строка целиком
+# находится в одной части, и результаты частей просто соединяются.
+def chunked_stat(chunks, func, axis=0, **kwargs):
+    if axis in (1, 'columns'):
+        return pd.concat([getattr(Moments(chunk.index).update(chunk.T),
+                                  func)(**kwargs)
+                          for chunk in chunks])
+    state = None
+    for chunk in chunks:
+        if state is None:
+            state = Moments(chunk.columns)
+        state.update(chunk)
+    return getattr(state, func)(**kwargs)
+
+
+# Моменты одной части данных; выполняется в отдельном процессе.
+def part_moments(seed):
+    return Moments(['x', 'y']).update(make_part(seed))
+
+
+def make_part(seed):
+    rng = np.random.default_rng(seed)
+    part = pd.DataFrame({'x': rng.lognormal(0, 1, 1_000_000),
+                         'y': rng.normal(seed, 1, 1_000_000)})
+    part.iloc[rng.random(len(part)) < 0.01, 0] = np.nan
+    return part
+
+
+def main():
+    # Таблица из ex03-01, разделённая на две части по две строки:
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    chunks = [df.iloc[:2], df.iloc[2:]]
+
+    print(chunked_stat(chunks, 'sum'))
+    # one    9.25
+    # two   -5.80
+    # dtype: float64
+
+    print(chunked_stat(chunks, 'mean', axis='columns', skipna=False))
+    # a      NaN
+    # b    1.300
+    # c      NaN
+    # d   -0.275
+    # dtype: float64
+
+    # Сравним все статистики с методами DataFrame:
+    state = Moments(df.columns)
+    for chunk in chunks:
+        state.update(chunk)
+    for func in ['sum', 'mean', 'var', 'std', 'skew', 'kurt']:
+        for skipna in [True, False]:
+            assert np.allclose(getattr(state, func)(skipna=skipna),
+                               getattr(df, func)(skipna=skipna),
+                               equal_nan=True)
+    print(state.skew())
+    # one    1.664846
+    # two         NaN
+    # dtype: float64
+
+    separator()
+
+    # Четыре части по миллиону строк обрабатываются в двух процессах. В
+    # родительский процесс передаются только моменты - по семь чисел на
+    # столбец:
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(2) as pool:
+        parts = list(pool.map(part_moments, range(4)))
+    state = parts[0]
+    for other in parts[1:]:
+        state.merge(other)
+    result = pd.DataFrame({func: getattr(state, func)()
+                           for func in ['sum', 'mean', 'var', 'std',
+                                        'skew', 'kurt']})
+    print(f"по частям: {time.perf_counter() - start:5.2f} с")
+    # по частям:  0.58 с
+
+    # Та же статистика по всей таблице в памяти:
+    start = time.perf_counter()
+    big = pd.concat([make_part(seed) for seed in range(4)])
+    expected = pd.DataFrame({func: getattr(big, func)()
+                             for func in ['sum', 'mean', 'var', 'std',
+                                          'skew', 'kurt']})
+    print(f"целиком:   {time.perf_counter() - start:5.2f} с")
+    # целиком:    1.18 с
+
+    print(result)
+    #             sum      mean       var       std      skew        kurt
+    # x  6.532119e+06  1.649421  4.712543  2.170839  6.747941  167.046432
+    # y  6.000662e+06  1.500166  2.246079  1.498692 -0.000672   -0.420755
+
+    print(np.allclose(result, expected, rtol=1e-10, atol=0))
+    # True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# Pandas - Описательная и сводная статистика
+#
+# Параллельные свёртки по столбцам очень широких таблиц.
+#
+# Методы sum, mean и idxmax из ex03-01 для таблицы с десятками тысяч
+# столбцов выполняются в одном потоке, и на каждый столбец приходятся
+# накладные расходы интерпретатора.
+#
+# Функция parallel_reduce группирует столбцы одного типа в двумерные
+# массивы NumPy (для таблицы из одного блока это представление без
+# копирования), делит их на полосы по несколько сотен столбцов и
+# сворачивает каждую полосу одним векторным вызовом NumPy в пуле потоков.
+# NumPy отпускает GIL на время вычислений, поэтому полосы обрабатываются
+# параллельно. Результат - Series с тем же индексом, что у метода DataFrame.
+import concurrent.futures
+import os
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Свёртка полосы x (строки × столбцы) по строкам. Для вещественных
+# столбцов пропуски учитываются так же, как в pandas; count учитывает
+# пропуски (NaN, NaT, None) в столбцах любых типов, кроме целых и
+# логических, где их не бывает.
+def _reduce(x, func, skipna):
+    if func == 'count':
+        if x.dtype.kind in 'iub':
+            return np.full(x.shape[1], x.shape[0])
+        return x.shape[0] - pd.isna(x).sum(axis=0)
+    if x.dtype.kind == 'b':
+        x = x.astype(np.int64)
+    if x.dtype.kind != 'f' or not skipna:
+        if func in ('idxmax', 'idxmin'):
+            if x.dtype.kind == 'f' and np.isnan(x).any():
+                raise ValueError("Encountered an NA value with skipna=False")
+            return getattr(x, 'arg' + func[3:])(axis=0)
+        if func == 'mean':
+            return x.mean(axis=0)
+        return getattr(x, func)(axis=0)
+
+    mask = np.isnan(x)
+    count = x.shape[0] - mask.sum(axis=0)
+    fill = {'sum': 0, 'mean': 0, 'min': np.inf, 'max': -np.inf,
+            'idxmin': np.inf, 'idxmax': -np.inf}[func]
+    filled = np.where(mask, fill, x)
+    if func in ('idxmax', 'idxmin'):
+        if (count == 0).any():
+            raise ValueError("Encountered all NA values")
+        return getattr(filled, 'arg' + func[3:])(axis=0)
+    if func == 'mean':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return filled.sum(axis=0) / count
+    result = getattr(filled, func)(axis=0)
+    if func != 'sum':
+        result = np.where(count > 0, result, np.nan)
+    return result
+
+
+# func - 'sum', 'mean', 'min', 'max', 'count', 'idxmax' или 'idxmin';
+# band - число столбцов в полосе; max_workers - число потоков.
+# Учитываются только числовые и логические столбцы (как numeric_only=True).
+def parallel_reduce(frame, func, skipna=True, band=256, max_workers=None):
+    if func != 'count':
+        frame = frame.select_dtypes(['number', 'bool'])
+    dtypes = frame.dtypes.to_numpy()
+    tasks = []
+    for dtype in pd.unique(dtypes):
+        positions = np.flatnonzero(dtypes == dtype)
+        block = frame.iloc[:, positions].to_numpy()
+        for start in range(0, len(positions), band):
+            tasks.append((positions[start:start + band],
+                          block[:, start:start + band]))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        results = list(pool.map(lambda task: _reduce(task[1], func, skipna),
+                                tasks))
+    values = np.empty(frame.shape[1], dtype=np.result_type(*results)
+                      if results else np.float64)
+    for (positions, _), result in zip(tasks, results):
+        values[positions] = result
+    if func in ('idxmax', 'idxmin'):
+        values = frame.index.take(values)
+    return pd.Series(values, index=frame.columns)
+
+
+def main():
+    # Таблица из ex03-01:
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    print(parallel_reduce(df, 'sum'))
+    # one    9.25
+    # two   -5.80
+    # dtype: float64
+
+    print(parallel_reduce(df, 'idxmax'))
+    # one    b
+    # two    d
+    # dtype: str
+
+    separator()
+
+    # Широкая таблица: 1000 строк, 40000 вещественных столбцов с пропусками
+    # и 10000 целочисленных:
+    rng = np.random.default_rng(0)
+    floats = rng.normal(0, 1, (1000, 40_000))
+    floats[rng.random(floats.shape) < 0.01] = np.nan
+    wide = pd.concat([pd.DataFrame(floats),
+                      pd.DataFrame(rng.integers(0, 100, (1000, 10_000)),
+                                   columns=range(40_000, 50_000))], axis=1)
+    del floats
+
+    for func in ['sum', 'mean', 'idxmax']:
+        start = time.perf_counter()
+        expected = getattr(wide, func)()
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        result = parallel_reduce(wide, func)
+        print(f"{func:<7} pandas {elapsed:6.3f} с, parallel_reduce "
+              f"{time.perf_counter() - start:6.3f} с,",
+              result.index.equals(expected.index) and
+              np.allclose(result.to_numpy(dtype=np.float64),
+                          expected.to_numpy(dtype=np.float64)))
+    # sum     pandas  0.259 с, parallel_reduce  0.162 с, True
+    # mean    pandas  0.247 с, parallel_reduce  0.180 с, True
+    # idxmax  pandas  0.289 с, parallel_reduce  0.189 с, True
+
+    separator()
+
+    # Зависимость времени от числа потоков для idxmax:
+    print(f"ядер: {os.cpu_count()}")
+    for workers in [1, 2, 4, 8, 16, 32]:
+        start = time.perf_counter()
+        parallel_reduce(wide, 'idxmax', max_workers=workers)
+        print(f"{workers:>2} потоков: {time.perf_counter() - start:6.3f} с")
+    # ядер: 1
+    #  1 потоков:  0.165 с
+    #  2 потоков:  0.170 с
+    #  4 потоков:  0.186 с
+    #  8 потоков:  0.191 с
+    # 16 потоков:  0.206 с
+    # 32 потоков:  0.228 с
+
+    # На одном ядре дополнительные потоки только добавляют накладные
+    # расходы. На многоядерной машине время уменьшается примерно
+    # пропорционально числу потоков до числа ядер, а затем упирается в
+    # пропускную способность памяти: каждое значение читается один раз,
+    # и вычислений на него приходится мало.
+
+
+if __name__ == '__main__':
+    main()
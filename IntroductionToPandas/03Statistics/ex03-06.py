@@ -0,0 +1,186 @@
+# Pandas - Описательная и сводная статистика
+#
+# Свёртки по строкам (axis='columns') блоками, помещающимися в кэш.
+#
+# В ex03-01 df.sum(axis='columns') и df.mean(axis='columns', skipna=False)
+# сворачивают значения каждой строки. pandas хранит столбцы одного типа
+# в двумерном блоке так, что подряд в памяти лежат значения одного
+# столбца, поэтому значения строки разбросаны по памяти. Кроме того, для
+# обработки пропусков pandas создаёт копию всего блока, а для таблицы со
+# столбцами разных типов - ещё и общий массив values.
+#
+# Функция rowwise_reduce обходит таблицу полосами строк (tiles), размер
+# которых подобран так, чтобы полоса результата помещалась в кэш L2
+# процессора. Для каждой полосы столбцы по очереди прибавляются к
+# результату на месте (для min и max - сравниваются с ним): значения
+# полосы одного столбца лежат в памяти подряд и читаются непосредственно
+# из блока pandas. Пропуски пропускаются аргументом where (np.fmin и
+# np.fmax пропускают NaN сами). Двумерный массив всей таблицы и его копии
+# не создаются, даже если таблица состоит из многих блоков.
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Свёртка строк по столбцам columns (одномерным массивам) полосами по
+# rows строк. Возвращает результат свёртки и число значений без пропусков
+# в строке.
+def _reduce_columns(columns, n, func, skipna, tile_bytes):
+    # В кэше находятся полоса результата, полоса столбца и маска:
+    rows = max(1, tile_bytes // 24)
+    ufunc = {'sum': np.add, 'mean': np.add,
+             'min': np.fmin if skipna else np.minimum,
+             'max': np.fmax if skipna else np.maximum, 'count': None}[func]
+    # Начальное значение не меняет результат: fmin и fmax пропускают NaN,
+    # а строка из одних NaN так и остаётся NaN.
+    initial = {np.add: 0.0, np.fmin: np.nan, np.fmax: np.nan,
+               np.minimum: np.inf, np.maximum: -np.inf, None: 0.0}[ufunc]
+    result = np.full(n, initial)
+    # Число значений нужно только для count и для sum и mean с пропуском
+    # NaN; min и max по строке из одних NaN и так возвращают NaN. Столбцы,
+    # пропуски в которых не считаются, учитываются в count сразу:
+    masked = skipna and func in ('sum', 'mean')
+    need_count = func == 'count' or masked
+    counted = [need_count and values.dtype.kind == 'f'
+               for values in columns]
+    count = np.full(n, len(columns) - sum(counted), dtype=np.intp)
+    mask = np.empty(min(rows, n), dtype=bool)
+    for start in range(0, n, rows):
+        out = result[start:start + rows]
+        tile_count = count[start:start + rows]
+        tile_mask = mask[:len(out)]
+        for values, mask_values in zip(columns, counted):
+            tile = values[start:start + rows]
+            if not mask_values:
+                if ufunc is not None:
+                    ufunc(out, tile, out=out)
+                continue
+            np.isnan(tile, out=tile_mask)
+            np.logical_not(tile_mask, out=tile_mask)
+            tile_count += tile_mask
+            if masked:
+                np.add(out, tile, out=out, where=tile_mask)
+    return result, count
+
+
+# func - 'sum', 'mean', 'min', 'max' или 'count'; skipna - как у методов
+# DataFrame; tile_bytes - размер полосы результата, столбца и маски
+# вместе в байтах (по умолчанию 256 КБ - часть кэша L2 на большинстве
+# современных процессоров; с полосами больше кэша свёртка медленнее).
+def rowwise_reduce(frame, func, skipna=True, tile_bytes=1 << 18):
+    frame = frame.select_dtypes(['number', 'bool'])
+    # Значения столбцов - представления блоков pandas, а не копии, сколько
+    # бы блоков ни было в таблице:
+    columns = [frame.iloc[:, j].to_numpy() for j in range(frame.shape[1])]
+    result, count = _reduce_columns(columns, len(frame), func, skipna,
+                                    tile_bytes)
+    if func == 'count':
+        return pd.Series(count, index=frame.index)
+    if not columns:
+        result = np.full(len(frame), 0.0 if func == 'sum' else np.nan)
+    if func == 'mean':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result /= count if skipna else frame.shape[1]
+    if func in ('mean', 'min', 'max'):
+        result[count == 0] = np.nan
+    dtypes = frame.dtypes
+    if (func in ('sum', 'min', 'max') and len(dtypes) and
+            all(dtype.kind in 'iub' for dtype in dtypes)):
+        result = result.astype(np.int64)
+    return pd.Series(result, index=frame.index)
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    # Таблица из ex03-01:
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    print(rowwise_reduce(df, 'sum'))
+    # a    1.40
+    # b    2.60
+    # c    0.00
+    # d   -0.55
+    # dtype: float64
+
+    print(rowwise_reduce(df, 'mean', skipna=False))
+    # a      NaN
+    # b    1.300
+    # c      NaN
+    # d   -0.275
+    # dtype: float64
+
+    separator()
+
+    # Высокая и широкая таблица: 200000 строк, 500 вещественных столбцов
+    # с пропусками (800 МБ) и 20 целочисленных:
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, 1, (200_000, 500))
+    values[rng.random(values.shape) < 0.01] = np.nan
+    big = pd.concat([pd.DataFrame(values, copy=False),
+                     pd.DataFrame(rng.integers(0, 100, (200_000, 20)),
+                                  columns=range(500, 520))], axis=1)
+    del values
+
+    for func, skipna in [('sum', True), ('mean', False), ('max', True)]:
+        expected, elapsed, peak = measure(
+            lambda: getattr(big, func)(axis='columns', skipna=skipna))
+        print(f"{func:<4} skipna={skipna!s:<5} pandas:         "
+              f"{elapsed:6.3f} с, пик {peak / 2 ** 20:7.1f} МБ")
+        result, elapsed, peak = measure(
+            lambda: rowwise_reduce(big, func, skipna=skipna))
+        print(f"{func:<4} skipna={skipna!s:<5} rowwise_reduce: "
+              f"{elapsed:6.3f} с, пик {peak / 2 ** 20:7.1f} МБ",
+              np.allclose(result, expected, equal_nan=True))
+    # sum  skipna=True  pandas:          3.253 с, пик  1785.3 МБ
+    # sum  skipna=True  rowwise_reduce:  0.780 с, пик     4.7 МБ True
+    # mean skipna=False pandas:          1.854 с, пик   799.8 МБ
+    # mean skipna=False rowwise_reduce:  0.366 с, пик     4.7 МБ True
+    # max  skipna=True  pandas:          2.835 с, пик  1785.3 МБ
+    # max  skipna=True  rowwise_reduce:  0.298 с, пик     4.7 МБ True
+
+    # Пиковая память rowwise_reduce - это маска одной полосы, результат и
+    # число значений в строке (по 200000 значений), она не зависит от
+    # числа столбцов.
+
+    # Таблица, собранная из отдельных столбцов, состоит из 200 блоков;
+    # общий массив её значений был бы копией (305 МБ):
+    del big
+    wide = pd.concat([pd.DataFrame({i: rng.normal(0, 1, 200_000)})
+                      for i in range(200)], axis=1)
+    result, elapsed, peak = measure(lambda: rowwise_reduce(wide, 'sum'))
+    print(f"200 блоков rowwise_reduce:        {elapsed:6.3f} с, пик "
+          f"{peak / 2 ** 20:7.1f} МБ",
+          np.allclose(result, wide.sum(axis='columns')))
+    # 200 блоков rowwise_reduce:         0.158 с, пик     4.9 МБ True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+# Pandas - Описательная и сводная статистика
+#
+# describe() для нечисловых столбцов: кодирование словарём и эскизы.
+#
+# Для Series с объектами (ex03-01) describe() возвращает count, unique, top
+# и freq. Для этого pandas строит полную таблицу частот value_counts():
+# на столбце с миллионами различных значений это и долго, и требует
+# памяти на каждое различное значение.
+#
+# Быстрый путь - кодирование словарём: pd.factorize один раз хэширует
+# значения и заменяет их целыми кодами, после чего частоты находятся
+# вызовом np.bincount, а top - вызовом argmax. Для категориальных столбцов
+# коды уже готовы.
+#
+# Потоковый режим читает столбец частями и хранит только два эскиза
+# фиксированного размера:
+#   - Misra-Gries с k счётчиками для top и freq: частота каждого значения
+#     занижена не более чем на n / (k + 1), где n - число значений;
+#   - HyperLogLog с 2**p регистрами для unique: относительная ошибка
+#     около 1.04 / sqrt(2**p) (0.8% при p=14).
+# Оба эскиза объединяются, поэтому части можно обрабатывать отдельно.
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Частоты значений через кодирование словарём: (значения, частоты) в
+# порядке первого появления. Пропуски не учитываются.
+def _value_counts(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy().astype(np.intp)
+        uniques = values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # Пропуски имеют код -1; после сдвига на единицу они попадают в
+    # нулевую ячейку, которая отбрасывается:
+    codes += 1
+    counts = np.bincount(codes, minlength=len(uniques) + 1)[1:]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Неиспользуемые категории не входят в unique:
+        used = counts > 0
+        return uniques[used], counts[used]
+    return uniques, counts
+
+
+# Аналог Series.describe() для нечисловых данных. При равных частотах
+# top - значение, которое встретилось раньше, как в value_counts().
+def factorize_describe(series):
+    uniques, counts = _value_counts(series)
+    top, freq = (uniques[counts.argmax()], counts.max()) if len(counts) \
+        else (np.nan, np.nan)
+    return pd.Series([counts.sum(), len(uniques), top, freq],
+                     index=['count', 'unique', 'top', 'freq'], dtype=object,
+                     name=series.name)
+
+
+# Эскиз Misra-Gries в объединяемом варианте: к счётчикам прибавляются
+# частоты очередной части, и если счётчиков стало больше k, из всех
+# вычитается (k+1)-я по величине частота, а неположительные удаляются.
+# Сумма вычтенных значений (decrement) - верхняя граница ошибки частот.
+class MisraGries:
+    def __init__(self, k=1000):
+        self.k = k
+        self.counters = pd.Series(dtype=np.int64)
+        self.decrement = 0
+        self.n = 0
+
+    def update(self, values):
+        return self.update_counts(*_value_counts(values))
+
+    # Добавление готовых частот (значения, частоты) одной части. Сначала
+    # частоты части сокращаются до k счётчиков, поэтому объединение со
+    # счётчиками эскиза затрагивает не больше 2k значений.
+    def update_counts(self, uniques, counts):
+        self.n += counts.sum()
+        threshold = 0
+        if len(counts) > self.k:
+            threshold = np.partition(counts, len(counts) - self.k - 1)[
+                len(counts) - self.k - 1]
+            keep = counts > threshold
+            uniques, counts = uniques[keep], counts[keep] - threshold
+        return self._add(pd.Series(counts, index=uniques), threshold)
+
+    def merge(self, other):
+        self.n += other.n
+        return self._add(other.counters, other.decrement)
+
+    # Наиболее частое значение, его оценка частоты и границы: истинная
+    # частота лежит в [freq, freq + decrement].
+    def top(self):
+        if self.counters.empty:
+            return np.nan, np.nan, np.nan
+        label = self.counters.idxmax()
+        freq = self.counters[label]
+        return label, freq, freq + self.decrement
+
+    def _add(self, counts, decrement):
+        counters = self.counters.add(counts, fill_value=0).astype(np.int64)
+        self.decrement += decrement
+        if len(counters) > self.k:
+            threshold = counters.nlargest(self.k + 1).iloc[-1]
+            counters = counters[counters > threshold] - threshold
+            self.decrement += threshold
+        self.counters = counters
+        return self
+
+
+# HyperLogLog: значения хэшируются функцией pd.util.hash_array; старшие p
+# бит хэша выбирают регистр, а в регистре хранится наибольшее число
+# младших нулевых бит остальной части хэша плюс один.
+class HyperLogLog:
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=object)
+        values = values[~pd.isna(values)]
+        hashes = pd.util.hash_array(values)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = hashes & np.uint64(2 ** (64 - self.p) - 1)
+        # Младший единичный бит: rest & -rest - степень двойки, которая
+        # точно представима в float64.
+        lowest = rest & (~rest + np.uint64(1))
+        with np.errstate(divide='ignore'):
+            rank = np.log2(lowest.astype(np.float64)) + 1
+        rank[rest == 0] = 64 - self.p + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(
+            np.int64)).sum()
+        zeros = np.count_nonzero(self.registers == 0)
+        # Поправка для малого числа значений (подсчёт пустых регистров):
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return estimate
+
+
+# Потоковый describe: count точный, unique - по HyperLogLog, top и freq -
+# по эскизу Misra-Gries. Память не зависит от числа различных значений.
+class StreamingDescribe:
+    def __init__(self, k=1000, p=14):
+        self.count = 0
+        self.heavy = MisraGries(k)
+        self.distinct = HyperLogLog(p)
+
+    # Часть кодируется словарём один раз: частоты идут в Misra-Gries, а в
+    # HyperLogLog - только различные значения части (повторы не меняют
+    # его регистров).
+    def update(self, values):
+        uniques, counts = _value_counts(pd.Series(values))
+        self.count += counts.sum()
+        self.heavy.update_counts(uniques, counts)
+        self.distinct.update(uniques)
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.heavy.merge(other.heavy)
+        self.distinct.merge(other.distinct)
+        return self
+
+    def describe(self, name=None):
+        top, freq, _ = self.heavy.top()
+        return pd.Series([self.count, round(self.distinct.estimate()), top,
+                          freq], index=['count', 'unique', 'top', 'freq'],
+                         dtype=object, name=name)
+
+    # Границы ошибок: unique - в пределах ±2 стандартных ошибок HyperLogLog
+    # (около 95% случаев), freq - гарантированный интервал Misra-Gries.
+    def error_bounds(self):
+        unique = self.distinct.estimate()
+        error = 2 * self.distinct.relative_error
+        _, low, high = self.heavy.top()
+        return pd.DataFrame({'low': [unique * (1 - error), low],
+                             'high': [unique * (1 + error), high]},
+                            index=['unique', 'freq'])
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    # Series из ex03-01:
+    obj = pd.Series(['a', 'a', 'b', 'c'] * 4)
+    print(factorize_describe(obj))
+    # count     16
+    # unique     3
+    # top        a
+    # freq       8
+    # dtype: object
+
+    print(StreamingDescribe().update(obj).describe())
+    # count     16
+    # unique     3
+    # top        a
+    # freq       8
+    # dtype: object
+
+    separator()
+
+    # 10 миллионов строк и около миллиона различных значений с
+    # распределением Ципфа:
+    rng = np.random.default_rng(0)
+    labels = np.array([f"id{i:07d}" for i in range(1_000_000)],
+                      dtype=object)
+    codes = (rng.zipf(1.2, 10_000_000) - 1) % len(labels)
+    big = pd.Series(labels[codes], dtype=object)
+    big[rng.random(len(big)) < 0.01] = None
+    del codes
+
+    def streaming():
+        state = StreamingDescribe(k=1000, p=14)
+        for start in range(0, len(big), 1_000_000):
+            state.update(big.iloc[start:start + 1_000_000])
+        return state
+
+    expected, elapsed, peak = measure(big.describe)
+    print(f"describe():         {elapsed:6.2f} с, пик "
+          f"{peak / 2 ** 20:6.1f} МБ")
+    result, elapsed, peak = measure(lambda: factorize_describe(big))
+    print(f"factorize_describe: {elapsed:6.2f} с, пик "
+          f"{peak / 2 ** 20:6.1f} МБ")
+    state, elapsed, peak = measure(streaming)
+    print(f"StreamingDescribe:  {elapsed:6.2f} с, пик "
+          f"{peak / 2 ** 20:6.1f} МБ")
+    # describe():           2.50 с, пик   44.6 МБ
+    # factorize_describe:   1.73 с, пик  116.5 МБ
+    # StreamingDescribe:    4.36 с, пик   40.9 МБ
+
+    # factorize_describe быстрее, но хранит коды всех строк (8 байт на
+    # строку). Пиковая память StreamingDescribe определяется размером
+    # части и k и не растёт ни с длиной столбца, ни с числом различных
+    # значений.
+
+    print(pd.concat({'describe': expected, 'factorize': result,
+                     'streaming': state.describe()}, axis=1))
+    #          describe  factorize  streaming
+    # count     9900502    9900502    9900502
+    # unique     619145     619145     623122
+    # top     id0000000  id0000000  id0000000
+    # freq      1769821    1769821    1769335
+
+    print(state.error_bounds())
+    #                  low          high
+    # unique  6.129963e+05  6.332478e+05
+    # freq    1.769335e+06  1.769821e+06
+
+
+if __name__ == '__main__':
+    main()
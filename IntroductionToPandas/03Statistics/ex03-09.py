@@ -0,0 +1,165 @@
+# Pandas - Описательная и сводная статистика
+#
+# Разности и процентные изменения для дописываемых временных рядов.
+#
+# Методы diff и pct_change из таблицы 6 (в ex04-01 - price.pct_change())
+# при каждом запуске обрабатывают всю историю цен, хотя за день к ней
+# добавляется одна строка.
+#
+# Класс IncrementalChange хранит последние periods строк исходных данных
+# (перенос) и для новой части вычисляет только её строки. Результаты
+# записываются в заранее выделенный буфер, ёмкость которого удваивается
+# при заполнении, поэтому добавление строки не копирует всю историю.
+# Вычисления те же, что в pandas: x - x_prev для diff и x / x_prev - 1
+# для pct_change (с fill_method=None - поведение по умолчанию в новых
+# версиях pandas), поэтому результат по частям совпадает с расчётом по
+# всей таблице бит в бит.
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+class IncrementalChange:
+    def __init__(self, columns, func='pct_change', periods=1, capacity=1024):
+        self.columns = pd.Index(columns)
+        self.func = func
+        self.periods = periods
+        self.carry = np.full((periods, len(self.columns)), np.nan)
+        self.buffer = np.empty((capacity, len(self.columns)))
+        self.size = 0
+        self.indexes = []
+
+    # Добавляет строки chunk и возвращает результат для них.
+    def append(self, chunk):
+        if not chunk.columns.equals(self.columns):
+            chunk = chunk[self.columns]
+        values = chunk.to_numpy(dtype=np.float64)
+        n = len(values)
+        if self.size + n > len(self.buffer):
+            self._grow(max(2 * len(self.buffer), self.size + n))
+        extended = np.concatenate([self.carry, values])
+        current = extended[self.periods:]
+        previous = extended[:-self.periods]
+        out = self.buffer[self.size:self.size + n]
+        if self.func == 'diff':
+            np.subtract(current, previous, out=out)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.divide(current, previous, out=out)
+                np.subtract(out, 1, out=out)
+        self.carry = extended[-self.periods:].copy()
+        self.size += n
+        self.indexes.append(chunk.index)
+        return pd.DataFrame(out, index=chunk.index, columns=self.columns,
+                            copy=False)
+
+    # Результат для всех добавленных строк (без копирования буфера).
+    def result(self):
+        index = self.indexes[0].append(self.indexes[1:]) if self.indexes \
+            else pd.Index([])
+        self.indexes = [index]
+        return pd.DataFrame(self.buffer[:self.size], index=index,
+                            columns=self.columns, copy=False)
+
+    def _grow(self, capacity):
+        buffer = np.empty((capacity, len(self.columns)))
+        buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+
+
+def main():
+    # Цены за 6 дней приходят частями по 4 и 2 строки:
+    price = pd.DataFrame({'AAPL': [10.0, 10.5, np.nan, 11.0, 10.8, 11.2],
+                          'IBM': [100, 101, 99, 102, 103, 101]},
+                         index=pd.bdate_range('2020-12-22', periods=6))
+    state = IncrementalChange(price.columns, 'pct_change')
+    state.append(price.iloc[:4])
+    print(state.append(price.iloc[4:]))
+    #                 AAPL       IBM
+    # 2020-12-28 -0.018182  0.009804
+    # 2020-12-29  0.037037 -0.019417
+
+    print(state.result().equals(price.pct_change()))
+    # True
+
+    separator()
+
+    # Проверим diff и pct_change для разных periods на частях случайной
+    # длины:
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01,
+                                                          (100_000, 4)),
+                                               axis=0)),
+                        columns=['AAPL', 'IBM', 'MSFT', 'GOOG'])
+    data[rng.random(data.shape) < 0.01] = np.nan
+    bounds = np.concatenate([[0], np.sort(rng.choice(len(data), 999,
+                                                     replace=False)),
+                             [len(data)]])
+    for func in ['diff', 'pct_change']:
+        for periods in [1, 5, 250]:
+            state = IncrementalChange(data.columns, func, periods)
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                state.append(data.iloc[a:b])
+            print(func, periods, state.result().equals(
+                getattr(data, func)(periods=periods)))
+    # diff 1 True
+    # diff 5 True
+    # diff 250 True
+    # pct_change 1 True
+    # pct_change 5 True
+    # pct_change 250 True
+
+    separator()
+
+    # Добавление одной строки к истории из 10 миллионов строк:
+    history = pd.DataFrame(100 + rng.random((10_000_000, 4)),
+                           columns=['AAPL', 'IBM', 'MSFT', 'GOOG'])
+    state = IncrementalChange(history.columns, 'pct_change')
+    state.append(history)
+    rows = [pd.DataFrame(100 + rng.random((1, 4)), columns=history.columns,
+                         index=[len(history) + i]) for i in range(10)]
+
+    full, incremental = [], []
+    for row in rows:
+        start = time.perf_counter()
+        history = pd.concat([history, row])
+        expected = history.pct_change()
+        full.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        state.append(row)
+        incremental.append(time.perf_counter() - start)
+    # Медиана по 10 добавлениям; в одном из них IncrementalChange удваивает
+    # буфер, и это добавление дольше остальных:
+    full, slowest = np.median(full), max(incremental)
+    incremental = np.median(incremental)
+    print(f"pct_change() всей истории:  {full * 1e3:9.3f} мс на строку")
+    print(f"IncrementalChange.append(): {incremental * 1e3:9.3f} мс "
+          f"на строку (наибольшее {slowest * 1e3:.1f} мс)")
+    print(f"ускорение: {full / incremental:.0f} раз")
+    print(state.result().equals(expected))
+    # pct_change() всей истории:    602.709 мс на строку
+    # IncrementalChange.append():     0.448 мс на строку (наибольшее 127.9 мс)
+    # ускорение: 1345 раз
+    # True
+
+    # Почти всё время append - накладные расходы на создание объектов
+    # pandas для одной строки; время не зависит от длины истории.
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+# Pandas - Описательная и сводная статистика
+#
+# k наибольших и наименьших значений по всем столбцам сразу.
+#
+# df.idxmax() из ex03-01 возвращает только одну метку - положение
+# максимума. Чтобы получить 50 наибольших значений каждого из 10000
+# столбцов, приходится вызывать nlargest (или sort_values) для каждого
+# столбца отдельно.
+#
+# Функция top_k работает с двумерными массивами столбцов одного типа:
+# np.argpartition за линейное время находит k наибольших (наименьших)
+# значений сразу во всех столбцах, и сортируются только эти k значений.
+# Пропуски при skipna=True не учитываются, как в idxmax; при равных
+# значениях, как в nlargest(keep='first'), выбирается строка, которая
+# стоит раньше.
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Позиции k наибольших (largest=True) или наименьших значений в каждом
+# столбце массива x, упорядоченные от лучшего к худшему; -1 - значения
+# нет (в столбце меньше k значений без пропусков).
+def _top_k_block(x, k, largest):
+    n = x.shape[0]
+    k = min(k, n)
+    # Для argpartition пропуски заменяются на худшее значение (-inf или
+    # inf). Настоящие бесконечности при этом равны пропускам, поэтому при
+    # выборе среди равных и при сортировке пропуски идут последними:
+    if x.dtype.kind == 'f':
+        missing = np.isnan(x)
+        x = np.where(missing, -np.inf if largest else np.inf, x)
+    else:
+        missing = np.zeros(x.shape, dtype=bool)
+    kth = n - k if largest else k - 1
+    positions = np.argpartition(x, kth, axis=0)
+    positions = positions[n - k:] if largest else positions[:k]
+    selected = np.take_along_axis(x, positions, axis=0)
+
+    # argpartition может выбрать любое из равных граничных значений; в
+    # столбцах, где не все равные границе значения попали в выборку,
+    # берутся значения без пропусков, а среди них - те, что стоят раньше:
+    threshold = selected.min(axis=0) if largest else selected.max(axis=0)
+    total = (x == threshold).sum(axis=0)
+    for j in np.flatnonzero(total > (selected == threshold).sum(axis=0)):
+        better = positions[selected[:, j] != threshold[j], j]
+        ties = np.flatnonzero(x[:, j] == threshold[j])
+        ties = ties[np.argsort(missing[ties, j], kind='stable')]
+        positions[:, j] = np.concatenate([better, ties[:k - len(better)]])
+
+    # Сортировка выбранных значений; при равенстве раньше идёт меньшая
+    # позиция, пропуски - в конце:
+    positions.sort(axis=0)
+    selected = np.take_along_axis(x, positions, axis=0)
+    if largest:
+        order = k - 1 - np.argsort(selected[::-1], axis=0,
+                                   kind='stable')[::-1]
+    else:
+        order = np.argsort(selected, axis=0, kind='stable')
+    positions = np.take_along_axis(positions, order, axis=0)
+    chosen = np.take_along_axis(missing, positions, axis=0)
+    positions = np.take_along_axis(
+        positions, np.argsort(chosen, axis=0, kind='stable'), axis=0)
+    positions[np.take_along_axis(missing, positions, axis=0)] = -1
+    return positions
+
+
+# k наибольших (largest=True) или наименьших значений каждого столбца
+# (axis=0) или каждой строки (axis='columns'). Возвращает две таблицы:
+# метки и значения. При axis=0 строки результата - места 0..k-1, столбцы -
+# столбцы frame; при axis='columns' строки - строки frame, столбцы - места.
+def top_k(frame, k, largest=True, axis=0, skipna=True):
+    frame = frame.select_dtypes(['number', 'bool'])
+    if not skipna and frame.isna().to_numpy().any():
+        raise ValueError("Encountered an NA value with skipna=False")
+    if axis in (1, 'columns'):
+        labels, values = top_k(frame.T.astype(np.float64), k, largest)
+        return labels.T, values.T
+
+    k = min(k, len(frame))
+    if k <= 0:
+        return (pd.DataFrame(columns=frame.columns, dtype=object),
+                pd.DataFrame(columns=frame.columns, dtype=np.float64))
+    positions = np.empty((k, frame.shape[1]), dtype=np.intp)
+    values = np.empty((k, frame.shape[1]))
+    dtypes = frame.dtypes.to_numpy()
+    for dtype in pd.unique(dtypes):
+        columns = np.flatnonzero(dtypes == dtype)
+        block = frame.iloc[:, columns].to_numpy()
+        found = _top_k_block(block, k, largest)
+        positions[:, columns] = found
+        values[:, columns] = np.where(
+            found >= 0, np.take_along_axis(block, found, axis=0), np.nan)
+    # Метки берутся из индекса одним вызовом take, чтобы сохранить их тип,
+    # например datetime64. Позиция -1 указывает на добавленный в конец
+    # индекса пропуск. Целые и логические метки при этом становятся
+    # объектами, а не float64, - как метки idxmax:
+    index = frame.index
+    if (positions < 0).any():
+        if index.dtype.kind in 'iub':
+            index = index.astype(object)
+        index = index.insert(len(index), np.nan)
+    labels = index.take(np.where(positions < 0, len(frame), positions).ravel())
+    labels = labels.to_numpy().reshape(positions.shape)
+    return (pd.DataFrame(labels, columns=frame.columns),
+            pd.DataFrame(values, columns=frame.columns))
+
+
+def main():
+    # Таблица из ex03-01:
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    labels, values = top_k(df, 3)
+    print(labels)
+    #   one  two
+    # 0   b    d
+    # 1   a    b
+    # 2   d  NaN
+
+    print(values)
+    #     one  two
+    # 0  7.10 -1.3
+    # 1  1.40 -4.5
+    # 2  0.75  NaN
+
+    # Первая строка совпадает с idxmax, а для наименьших - с idxmin:
+    print(np.array_equal(labels.iloc[0], df.idxmax()),
+          np.array_equal(top_k(df, 1, largest=False)[0].iloc[0],
+                         df.idxmin()))
+    # True True
+
+    # По строкам:
+    print(top_k(df, 2, axis='columns')[0])
+    #      0    1
+    # a  one  NaN
+    # b  one  two
+    # c  NaN  NaN
+    # d  one  two
+
+    separator()
+
+    # 50 наибольших значений в каждом из 10000 столбцов по 2000 строк;
+    # целочисленные столбцы с частыми повторами проверяют выбор при
+    # равенстве:
+    rng = np.random.default_rng(0)
+    floats = rng.normal(0, 1, (2000, 8000))
+    floats[rng.random(floats.shape) < 0.05] = np.nan
+    wide = pd.concat([pd.DataFrame(floats),
+                      pd.DataFrame(rng.integers(0, 100, (2000, 2000)),
+                                   columns=range(8000, 10_000))], axis=1)
+    wide.index = pd.date_range('2015-01-01', periods=2000)
+
+    start = time.perf_counter()
+    expected = {column: wide[column].nlargest(50) for column in wide}
+    print(f"nlargest по столбцам: {time.perf_counter() - start:6.3f} с")
+    start = time.perf_counter()
+    labels, values = top_k(wide, 50)
+    print(f"top_k:                {time.perf_counter() - start:6.3f} с")
+    print(all(np.array_equal(labels[column].dropna().to_numpy(),
+                             series.index.to_numpy()) and
+              np.array_equal(values[column].dropna(), series)
+              for column, series in expected.items()))
+    # nlargest по столбцам:  8.528 с
+    # top_k:                 0.609 с
+    # True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# Pandas - Описательная и сводная статистика
+#
+# Кэш сводной статистики по содержимому столбцов.
+#
+# В тетрадях и пакетных заданиях describe(), sum() и mean() из ex03-01
+# снова и снова вызываются для таблиц, которые с прошлого раза не
+# изменились, и каждый раз всё считается заново.
+#
+# Класс StatsCache хранит результаты для каждого столбца отдельно. Ключ -
+# отпечаток содержимого столбца (контрольная сумма CRC32 его данных,
+# длина и тип), имя метода и его аргументы. Отпечаток вычисляется за один
+# быстрый проход по памяти, и это намного дешевле самой статистики. Если
+# значение в таблице изменилось, меняется отпечаток только этого столбца,
+# и пересчитывается только он. Кэш ограничен по памяти: при превышении
+# бюджета удаляются результаты, которые дольше всего не использовались
+# (LRU). Столбцы с одинаковым содержимым делят один результат.
+import collections
+import sys
+import time
+import zlib
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Отпечаток столбца. Для объектов в массиве хранятся указатели, поэтому
+# контрольная сумма считается по хэшам значений (pd.util.hash_array).
+def fingerprint(values):
+    if values.dtype.kind == 'O':
+        data = pd.util.hash_array(values)
+    else:
+        data = np.ascontiguousarray(values)
+    return zlib.crc32(data), values.shape, str(values.dtype)
+
+
+class StatsCache:
+    # Методы, результат которых для каждого столбца зависит только от
+    # этого столбца:
+    methods = ('describe', 'sum', 'mean', 'std', 'var', 'min', 'max',
+               'median', 'count')
+
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        if name not in self.methods:
+            raise AttributeError(name)
+        return lambda frame, **kwargs: self.compute(frame, name, **kwargs)
+
+    # Результат frame.<func>(**kwargs) для числовых столбцов (как при
+    # numeric_only=True). describe, как в pandas, не включает логические
+    # столбцы. Свёртки по строкам (axis='columns') не кэшируются.
+    def compute(self, frame, func, **kwargs):
+        numeric = frame.select_dtypes('number' if func == 'describe'
+                                      else ['number', 'bool'])
+        if func == 'describe' and numeric.shape[1] == 0:
+            # Без числовых столбцов describe описывает остальные, как в
+            # pandas; такой результат не кэшируется.
+            return frame.describe(**kwargs)
+        frame = numeric
+        if kwargs.get('axis', 0) in (1, 'columns'):
+            return getattr(frame, func)(**kwargs)
+        # Списки в аргументах (percentiles=[0.1, 0.9]) заменяются
+        # кортежами, чтобы ключ можно было хэшировать:
+        params = tuple(sorted(
+            (name, tuple(value) if isinstance(value, (list, np.ndarray))
+             else value) for name, value in kwargs.items()))
+        keys = [(fingerprint(frame.iloc[:, i].to_numpy()), func, params)
+                for i in range(frame.shape[1])]
+
+        results = {}
+        missing = []
+        for i, key in enumerate(keys):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                results[i] = self.entries[key]
+                self.hits += 1
+            else:
+                missing.append(i)
+                self.misses += 1
+        # Недостающие столбцы считаются по группам одного типа: результат
+        # для столбца не должен зависеть от соседних (сумма целых столбцов
+        # вместе с вещественными была бы float64).
+        dtypes = frame.dtypes.to_numpy()
+        for dtype in pd.unique(dtypes[missing]):
+            group = [i for i in missing if dtypes[i] == dtype]
+            computed = getattr(frame.iloc[:, group], func)(**kwargs)
+            for column, i in enumerate(group):
+                value = computed.iloc[:, column] if func == 'describe' \
+                    else computed.iloc[column]
+                results[i] = value
+                self._store(keys[i], value)
+
+        values = [results[i] for i in range(frame.shape[1])]
+        if func == 'describe':
+            return pd.concat(values, axis=1, keys=frame.columns)
+        return pd.Series(values, index=frame.columns, dtype=None if values
+                         else np.float64)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries), 'nbytes': self.nbytes}
+
+    def _store(self, key, value):
+        if key in self.entries:
+            return
+        size = value.memory_usage(deep=True) \
+            if isinstance(value, pd.Series) else sys.getsizeof(value)
+        self.entries[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= old.memory_usage(deep=True) \
+                if isinstance(old, pd.Series) else sys.getsizeof(old)
+
+
+def main():
+    # Таблица из ex03-01:
+    df = pd.DataFrame([[1.4, np.nan], [7.1, -4.5],
+                       [np.nan, np.nan], [0.75, -1.3]],
+                      index=['a', 'b', 'c', 'd'],
+                      columns=['one', 'two'])
+    cache = StatsCache()
+    print(cache.sum(df))
+    # one    9.25
+    # two   -5.80
+    # dtype: float64
+
+    print(cache.sum(df).equals(df.sum()), cache.info())
+    # True {'hits': 2, 'misses': 2, 'entries': 2, 'nbytes': 64}
+
+    # Изменим одно значение - пересчитывается только столбец two:
+    df.loc['c', 'two'] = 1.0
+    print(cache.sum(df).equals(df.sum()), cache.info())
+    # True {'hits': 3, 'misses': 3, 'entries': 3, 'nbytes': 96}
+
+    separator()
+
+    # Таблица из 2 миллионов строк и 20 столбцов:
+    rng = np.random.default_rng(0)
+    big = pd.DataFrame(rng.normal(0, 1, (2_000_000, 20)),
+                       columns=[f"c{i:02d}" for i in range(20)])
+    cache = StatsCache()
+
+    start = time.perf_counter()
+    expected = big.describe()
+    print(f"describe():                  {time.perf_counter() - start:6.3f} с")
+    for title in ['первый вызов', 'повторный вызов']:
+        start = time.perf_counter()
+        result = cache.describe(big)
+        print(f"StatsCache, {title + ':':<16} "
+              f"{time.perf_counter() - start:6.3f} с")
+    print(result.equals(expected), cache.info())
+    # describe():                   2.572 с
+    # StatsCache, первый вызов:     2.544 с
+    # StatsCache, повторный вызов:  0.133 с
+    # True {'hits': 20, 'misses': 20, 'entries': 20, 'nbytes': 10940}
+
+    # Повторный вызов тратит время только на контрольные суммы 320 МБ
+    # данных.
+
+    big.iloc[1000, 5] = np.nan
+    start = time.perf_counter()
+    result = cache.describe(big)
+    print(f"после изменения столбца:     {time.perf_counter() - start:6.3f} с")
+    print(result.equals(big.describe()), cache.info())
+    # после изменения столбца:      0.336 с
+    # True {'hits': 39, 'misses': 21, 'entries': 21, 'nbytes': 11487}
+
+    separator()
+
+    # При бюджете 4000 байт в кэше остаются результаты только для
+    # последних использованных столбцов:
+    cache = StatsCache(max_bytes=4000)
+    cache.describe(big)
+    print(cache.info())
+    # {'hits': 0, 'misses': 20, 'entries': 7, 'nbytes': 3829}
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+# Pandas - Чтение и запись данных
+#
+# Параллельная загрузка данных для множества биржевых тикеров.
+#
+# В примере ex04-01 словарь all_data заполняется по одному тикеру за раз,
+# поэтому время загрузки равно сумме времён всех сетевых запросов. Почти всё
+# это время программа просто ждёт ответа сервера, а значит запросы можно
+# выполнять одновременно в ограниченном пуле потоков или с помощью asyncio.
+import asyncio
+import concurrent.futures
+import functools
+import http.server
+import io
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+
+import pandas as pd
+import numpy as np
+# import pandas_datareader.data as web
+import pandas_datareader as web
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Локальный сервер котировок
+#
+# Чтобы измерять пропускную способность загрузчика без выхода в Интернет,
+# поднимем локальный HTTP-сервер, который отвечает на запросы
+# GET /quote?ticker=AAPL&start=2020-01-01 таблицей CSV в том же формате,
+# что и Yahoo Finance (столбцы High, Low, Open, Close, Volume, Adj Close).
+# Цены генерируются случайным блужданием от 2000-01-03, начальное значение
+# генератора зависит только от тикера, поэтому ответы воспроизводимы, а
+# значения за прошедшие даты не меняются при сдвиге end. Готовые ответы
+# кэшируются, чтобы сервер тратил процессорное время только на отправку.
+# Атрибут delay задаёт искусственную задержку ответа в секундах.
+def synthetic_quotes(ticker, end='2020-12-31', periods=2520):
+    seed = zlib.crc32(ticker.encode())
+    dates = pd.bdate_range('2000-01-03', end, name='Date')
+    n = len(dates)
+
+    def rng(stream):
+        return np.random.default_rng([seed, stream])
+
+    close = 100 * np.exp(np.cumsum(rng(0).normal(0, 0.02, n)))
+    spread = close * rng(1).uniform(0, 0.02, n)
+    data = pd.DataFrame({
+        'High': close + spread,
+        'Low': close - spread,
+        'Open': close + spread * rng(2).uniform(-1, 1, n),
+        'Close': close,
+        'Volume': rng(3).integers(10 ** 5, 10 ** 7, n),
+        'Adj Close': close * 0.98,
+    }, index=dates)
+    return data.iloc[-periods:]
+
+
+@functools.lru_cache(maxsize=4096)
+def quote_csv(ticker, end, periods, start=None):
+    data = synthetic_quotes(ticker, end=end, periods=periods)
+    if start is not None:
+        data = data[data.index >= start]
+    return data.to_csv().encode()
+
+
+class QuoteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path != '/quote' or 'ticker' not in query:
+            self.send_error(404)
+            return
+        time.sleep(self.server.delay)
+        start = query['start'][0] if 'start' in query else None
+        self.send_body(quote_csv(query['ticker'][0], self.server.end,
+                                 self.server.periods, start))
+
+    def send_body(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_quote_server(delay=0.05, end='2020-12-31', periods=2520,
+                       handler=QuoteHandler):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.end = end
+    server.periods = periods
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    server.url = f"http://{host}:{port}"
+    return server
+
+
+def stop_quote_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+# Функция загрузки одного тикера с локального сервера. Она возвращает такой
+# же DataFrame, как web.get_data_yahoo: даты в индексе и столбцы с ценами.
+def quote_fetcher(base_url):
+    def fetch(ticker, timeout=None, start=None):
+        query = {'ticker': ticker}
+        if start is not None:
+            query['start'] = str(pd.Timestamp(start).date())
+        url = f"{base_url}/quote?{urllib.parse.urlencode(query)}"
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+        return pd.read_csv(io.BytesIO(body), index_col='Date',
+                           parse_dates=True)
+    return fetch
+
+
+def yahoo_fetch(ticker, timeout=None):
+    return web.get_data_yahoo(ticker, timeout=timeout)
+
+
+# Загрузка с пулом потоков
+#
+# Функция load_all возвращает тот же словарь {тикер: DataFrame}, что и
+# генератор словаря из ex04-01, поэтому дальнейшая сборка price и volume не
+# меняется. Параметры:
+#   fetch        - функция загрузки одного тикера (по умолчанию Yahoo);
+#   max_workers  - максимальное число одновременных запросов;
+#   timeout      - время ожидания одного тикера в секундах (в обоих
+#                  режимах отсчитывается от начала его загрузки);
+#   mode         - 'threads' (пул потоков) или 'asyncio' (цикл событий);
+#   errors       - 'raise' пробрасывает первую ошибку, 'ignore' пропускает
+#                  тикеры, которые не удалось загрузить.
+# Порядок ключей в результате совпадает с порядком tickers.
+def load_all(tickers, fetch=yahoo_fetch, max_workers=8, timeout=30,
+             mode='threads', errors='raise'):
+    if errors not in ('raise', 'ignore'):
+        raise ValueError(f"errors must be 'raise' or 'ignore', got {errors!r}")
+    tickers = list(tickers)
+    if mode == 'threads':
+        results = _load_threads(tickers, fetch, max_workers, timeout)
+    elif mode == 'asyncio':
+        results = asyncio.run(
+            load_all_async(tickers, fetch, max_workers, timeout))
+    else:
+        raise ValueError(f"mode must be 'threads' or 'asyncio', got {mode!r}")
+
+    all_data = {}
+    for ticker, result in zip(tickers, results):
+        if isinstance(result, BaseException):
+            if errors == 'raise':
+                raise result
+            continue
+        all_data[ticker] = result
+    return all_data
+
+
+# Ожидание каждого тикера ограничено timeout секундами с момента начала
+# его загрузки, как и в варианте на asyncio: если fetch не соблюдает свой
+# timeout и зависает, результатом для тикера будет TimeoutError. Зависший
+# поток нельзя прервать - пул закрывается без ожидания его завершения.
+def _load_threads(tickers, fetch, max_workers, timeout):
+    started = {}
+
+    def load_one(i, ticker):
+        started[i] = time.monotonic()
+        return fetch(ticker, timeout=timeout)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+    pending = {pool.submit(load_one, i, ticker): i
+               for i, ticker in enumerate(tickers)}
+    results = [None] * len(tickers)
+    try:
+        while pending:
+            wait = None
+            if timeout is not None:
+                deadlines = [started[i] + timeout
+                             for i in pending.values() if i in started]
+                wait = max(0, min(deadlines) - time.monotonic()) \
+                    if deadlines else timeout
+            done, _ = concurrent.futures.wait(
+                pending, wait, concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = \
+                    future.exception() or future.result()
+            if timeout is None:
+                continue
+            now = time.monotonic()
+            for future, i in list(pending.items()):
+                if i in started and now >= started[i] + timeout:
+                    del pending[future]
+                    results[i] = TimeoutError()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+# Вариант на asyncio удобен, если загрузка встраивается в программу, уже
+# работающую в цикле событий. Блокирующий вызов fetch выполняется в пуле
+# из max_workers потоков, который и ограничивает число одновременных
+# запросов. asyncio.wait_for прекращает ожидание тикера через timeout
+# секунд после того, как поток начал его загрузку, - время в очереди пула
+# не учитывается, как и в _load_threads. Зависший поток, как и там, занимает
+# место в пуле до своего завершения.
+async def load_all_async(tickers, fetch=yahoo_fetch, max_workers=8,
+                         timeout=30):
+    loop = asyncio.get_running_loop()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    async def load_one(ticker):
+        started = loop.create_future()
+
+        def run():
+            loop.call_soon_threadsafe(started.set_result, None)
+            return fetch(ticker, timeout=timeout)
+
+        call = loop.run_in_executor(pool, run)
+        await started
+        return await asyncio.wait_for(call, timeout)
+
+    try:
+        return await asyncio.gather(*(load_one(ticker) for ticker in tickers),
+                                    return_exceptions=True)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    # Запустим локальный сервер котировок с задержкой ответа 50 мс:
+    server = start_quote_server(delay=0.05, periods=250)
+    fetch = quote_fetcher(server.url)
+    tickers = [f"T{i:04d}" for i in range(200)]
+    load_all(tickers, fetch, max_workers=16)
+
+    # Сравним время загрузки 200 тикеров при разном числе одновременных
+    # запросов. max_workers=1 соответствует последовательной загрузке из
+    # примера ex04-01:
+    print("Загрузка 200 тикеров, задержка сервера 50 мс:")
+    for mode in ['threads', 'asyncio']:
+        for max_workers in [1, 4, 16, 64]:
+            start = time.perf_counter()
+            all_data = load_all(tickers, fetch, max_workers=max_workers,
+                                timeout=5, mode=mode)
+            elapsed = time.perf_counter() - start
+            print(f"{mode:>8} max_workers={max_workers:<3}"
+                  f"{elapsed:7.2f} с {len(tickers) / elapsed:8.1f} тикер/с")
+    # Загрузка 200 тикеров, задержка сервера 50 мс:
+    #  threads max_workers=1    11.21 с     17.8 тикер/с
+    #  threads max_workers=4     3.25 с     61.6 тикер/с
+    #  threads max_workers=16    2.61 с     76.6 тикер/с
+    #  threads max_workers=64    1.81 с    110.7 тикер/с
+    #  asyncio max_workers=1    11.63 с     17.2 тикер/с
+    #  asyncio max_workers=4     3.61 с     55.4 тикер/с
+    #  asyncio max_workers=16    2.78 с     72.0 тикер/с
+    #  asyncio max_workers=64    2.03 с     98.4 тикер/с
+
+    # При дальнейшем росте max_workers время упирается уже не в сеть,
+    # а в разбор CSV (read_csv) на стороне клиента.
+
+    separator()
+
+    # Результат - тот же словарь, поэтому price и volume собираются так же,
+    # как в ex04-01:
+    all_data = load_all(['AAPL', 'IBM', 'MSFT', 'GOOG'], fetch)
+    price = pd.DataFrame({ticker: data['Adj Close']
+                          for ticker, data in all_data.items()})
+    volume = pd.DataFrame({ticker: data['Volume']
+                           for ticker, data in all_data.items()})
+    print(price.tail())
+    #                  AAPL         IBM       MSFT        GOOG
+    # Date
+    # 2020-12-25  59.080162  147.184025  42.499396  312.317532
+    # 2020-12-28  59.236017  144.767632  42.415353  304.034406
+    # 2020-12-29  60.657427  150.800141  42.417360  305.565654
+    # 2020-12-30  63.051087  145.637268  42.962280  302.047914
+    # 2020-12-31  64.522433  145.990783  42.681335  306.120467
+
+    print(volume.tail())
+    #                AAPL      IBM     MSFT     GOOG
+    # Date
+    # 2020-12-25  3391501  4289868  4103955  4126030
+    # 2020-12-28  4915404  3960930   130138  5466586
+    # 2020-12-29  6745621  1341390   672386  1399376
+    # 2020-12-30  5471562  1306948  7797338  2978864
+    # 2020-12-31  2997278  3208307  9766007  9730883
+
+    stop_quote_server(server)
+
+    # При работе с Yahoo Finance достаточно не передавать аргумент fetch:
+    # all_data = load_all(['AAPL', 'IBM', 'MSFT', 'GOOG'], max_workers=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# Pandas - Чтение и запись данных
+#
+# Инкрементальный кэш котировок на диске.
+#
+# Каждый запуск ex04-01 заново загружает всю историю цен, хотя новыми
+# оказываются лишь несколько последних строк. Сохраним загруженные данные
+# на диск в колоночном виде: для каждого тикера - отдельный каталог, в нём
+# по одному двоичному файлу на столбец и файл meta.json с описанием. Файлы
+# столбцов читаются через np.memmap, а при обновлении новые строки
+# дописываются в конец файлов без перезаписи старых.
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.parse
+
+import pandas as pd
+import numpy as np
+# import pandas_datareader.data as web
+import pandas_datareader as web
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+def yahoo_fetch(ticker, start=None, timeout=30):
+    return web.get_data_yahoo(ticker, start=start, timeout=timeout)
+
+
+# Кэш котировок
+#
+# Структура каталога кэша:
+#   root/AAPL/meta.json   - столбцы, типы, число строк и служебные метки;
+#   root/AAPL/index.bin   - даты (datetime64[ns] как int64);
+#   root/AAPL/0.bin, ...  - значения столбцов в порядке meta['columns'].
+# Число строк в meta.json - единственный источник истины: если запись
+# прервалась после дописывания данных, но до обновления meta.json, лишние
+# байты будут отброшены при следующем обновлении.
+#
+# Параметры:
+#   fetch      - функция загрузки fetch(ticker, start=None), возвращающая
+#                DataFrame с датами в индексе (как web.get_data_yahoo);
+#   ttl        - сколько секунд данные считаются свежими; пока срок не
+#                истёк, сеть не используется совсем;
+#   max_bytes  - предельный размер кэша; при превышении удаляются тикеры,
+#                к которым дольше всего не обращались.
+class PriceCache:
+    def __init__(self, root, fetch=yahoo_fetch, ttl=12 * 60 * 60,
+                 max_bytes=None):
+        self.root = root
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, ticker):
+        meta = self._read_meta(ticker)
+        now = time.time()
+        if meta is None:
+            self._write(ticker, self.fetch(ticker), now)
+        elif now - meta['fetched_at'] >= self.ttl:
+            self._refresh(ticker, meta, now)
+        meta = self._read_meta(ticker)
+        meta['last_access'] = now
+        self._write_meta(ticker, meta)
+        return self._read(ticker, meta)
+
+    # Возвращает такой же словарь {тикер: DataFrame}, как в ex04-01:
+    def load_all(self, tickers):
+        all_data = {ticker: self.get(ticker) for ticker in tickers}
+        self.evict()
+        return all_data
+
+    def evict(self):
+        if self.max_bytes is None:
+            return []
+        metas = [meta for meta in map(self._read_meta, self.tickers())
+                 if meta is not None]
+        metas.sort(key=lambda meta: meta['last_access'])
+        total = sum(meta['nbytes'] for meta in metas)
+        evicted = []
+        for meta in metas:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._path(meta['ticker']))
+            total -= meta['nbytes']
+            evicted.append(meta['ticker'])
+        return evicted
+
+    def nbytes(self):
+        return sum(self._read_meta(ticker)['nbytes']
+                   for ticker in self.tickers())
+
+    def tickers(self):
+        return sorted(urllib.parse.unquote(name)
+                      for name in os.listdir(self.root))
+
+    # Дозагрузка: запрашиваем только даты после последней сохранённой
+    # строки и дописываем их в конец файлов столбцов.
+    def _refresh(self, ticker, meta, now):
+        if meta['last_date'] is None:
+            # Сохранённых строк нет (например, бумага только что начала
+            # торговаться) - загружаем всё заново.
+            self._write(ticker, self.fetch(ticker), now)
+            return
+        last = pd.Timestamp(meta['last_date'])
+        data = self.fetch(ticker, start=last + pd.Timedelta(days=1))
+        data = data[data.index > last]
+        if list(data.columns) != meta['columns'] or len(data) and [
+                str(dtype) for dtype in data.dtypes] != meta['dtypes']:
+            # Состав или типы столбцов у источника изменились (например,
+            # в Volume появился NaN и столбец стал float64) - загружаем
+            # заново, чтобы не приводить новые строки к старому типу.
+            self._write(ticker, self.fetch(ticker), now)
+            return
+        if len(data):
+            self._append(ticker, meta, data)
+        meta['fetched_at'] = now
+        self._write_meta(ticker, meta)
+
+    def _write(self, ticker, data, now):
+        path = self._path(ticker)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        meta = {
+            'ticker': ticker,
+            'columns': list(data.columns),
+            'dtypes': [str(dtype) for dtype in data.dtypes],
+            'rows': 0,
+            'nbytes': 0,
+            'last_date': None,
+            'fetched_at': now,
+            'last_access': now,
+        }
+        self._append(ticker, meta, data)
+
+    def _append(self, ticker, meta, data):
+        index = data.index.values.astype('datetime64[ns]').view('i8')
+        arrays = [('index.bin', index, 'i8')]
+        arrays += [(f"{i}.bin", data[column].to_numpy(), dtype)
+                   for i, (column, dtype)
+                   in enumerate(zip(meta['columns'], meta['dtypes']))]
+        for name, values, dtype in arrays:
+            dtype = np.dtype(dtype)
+            with open(os.path.join(self._path(ticker), name), 'ab') as f:
+                f.truncate(meta['rows'] * dtype.itemsize)
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        meta['rows'] += len(data)
+        meta['nbytes'] = meta['rows'] * sum(np.dtype(dtype).itemsize
+                                            for _, _, dtype in arrays)
+        if len(data):
+            meta['last_date'] = str(data.index[-1])
+        self._write_meta(ticker, meta)
+
+    def _read(self, ticker, meta):
+        def column(name, dtype):
+            if meta['rows'] == 0:
+                return np.empty(0, dtype=dtype)
+            return np.memmap(os.path.join(self._path(ticker), name),
+                             dtype=dtype, mode='r', shape=(meta['rows'],))
+
+        index = pd.DatetimeIndex(column('index.bin', 'i8')
+                                 .view('datetime64[ns]'), name='Date')
+        return pd.DataFrame({name: column(f"{i}.bin", dtype)
+                             for i, (name, dtype)
+                             in enumerate(zip(meta['columns'],
+                                              meta['dtypes']))},
+                            index=index)
+
+    def _path(self, ticker):
+        return os.path.join(self.root, urllib.parse.quote(ticker, safe=''))
+
+    def _read_meta(self, ticker):
+        try:
+            with open(os.path.join(self._path(ticker), 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # meta.json заменяется атомарно: сначала пишется временный файл.
+    def _write_meta(self, ticker, meta):
+        path = os.path.join(self._path(ticker), 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+
+def main():
+    # Источником данных будет локальный сервер котировок из примера ex04-02.
+    # Обёртка над fetch считает загруженные по сети строки:
+    quotes = importlib.import_module('ex04-02')
+    server = quotes.start_quote_server(delay=0.05, end='2020-12-30')
+    fetch = quotes.quote_fetcher(server.url)
+    downloaded = []
+
+    def counting_fetch(ticker, start=None):
+        data = fetch(ticker, start=start)
+        downloaded.append(len(data))
+        return data
+
+    tickers = ['AAPL', 'IBM', 'MSFT', 'GOOG']
+    root = tempfile.mkdtemp()
+    cache = PriceCache(root, counting_fetch, ttl=60)
+
+    # Холодный старт: вся история загружается и сохраняется на диск:
+    start = time.perf_counter()
+    all_data = cache.load_all(tickers)
+    print(f"Холодный старт: {time.perf_counter() - start:.3f} с, "
+          f"загружено строк: {sum(downloaded)}")
+    # Холодный старт: 0.871 с, загружено строк: 10080
+
+    # Тёплый старт: срок ttl не истёк, данные читаются с диска без сети:
+    downloaded.clear()
+    start = time.perf_counter()
+    all_data = cache.load_all(tickers)
+    print(f"Тёплый старт: {time.perf_counter() - start:.3f} с, "
+          f"загружено строк: {sum(downloaded)}")
+    # Тёплый старт: 0.007 с, загружено строк: 0
+
+    separator()
+
+    # Наступил следующий торговый день, а срок свежести истёк. Кэш запросит
+    # у источника только даты после последней сохранённой строки:
+    server.end = '2020-12-31'
+    cache.ttl = 0
+    downloaded.clear()
+    all_data = cache.load_all(tickers)
+    print(f"Обновление: загружено строк: {sum(downloaded)}")
+    # Обновление: загружено строк: 4
+
+    price = pd.DataFrame({ticker: data['Adj Close']
+                          for ticker, data in all_data.items()})
+    print(price.tail(3))
+    #                  AAPL         IBM       MSFT        GOOG
+    # Date
+    # 2020-12-29  60.657427  150.800141  42.417360  305.565654
+    # 2020-12-30  63.051087  145.637268  42.962280  302.047914
+    # 2020-12-31  64.522433  145.990783  42.681335  306.120467
+
+    # Источник отдаёт последние 2520 торговых дней, в кэше на один день
+    # больше. Общая часть совпадает с полной загрузкой:
+    print(all_data['MSFT'].iloc[-2520:].equals(fetch('MSFT')))
+    # True
+
+    separator()
+
+    # Ограничим размер кэша: при превышении max_bytes удаляются тикеры,
+    # к которым дольше всего не обращались:
+    cache.ttl = 60
+    cache.max_bytes = cache.nbytes() * 3 // 4
+    cache.get('IBM')
+    print(cache.evict())
+    # ['AAPL']
+    print(cache.tickers())
+    # ['GOOG', 'IBM', 'MSFT']
+
+    quotes.stop_quote_server(server)
+    shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
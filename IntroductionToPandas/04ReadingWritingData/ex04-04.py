@@ -0,0 +1,168 @@
+# Pandas - Чтение и запись данных
+#
+# Сборка выровненной панели цен и объёмов за один проход.
+#
+# В ex04-01 таблицы price и volume строятся двумя отдельными проходами по
+# all_data. Каждый вызов pd.DataFrame({ticker: Series}) заново вычисляет
+# объединение индексов всех рядов и переиндексирует каждый ряд, создавая
+# промежуточные копии. Если календарь (объединение дат) вычислить один раз,
+# то значения всех полей можно разложить по заранее выделенным двумерным
+# массивам за один проход по тикерам.
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Функция build_panel принимает словарь {тикер: DataFrame} (как all_data в
+# ex04-01) и список полей, а возвращает словарь {поле: DataFrame}, где
+# строки - общий календарь, а столбцы - тикеры.
+#
+# Для каждого поля выделяется один массив формы (число тикеров, число дат):
+# значения одного тикера записываются в непрерывную строку этого массива, а
+# транспонированный массив передаётся в DataFrame без копирования.
+# Целочисленные поля (например, Volume) остаются int64, если у всех тикеров
+# есть все даты календаря; иначе, как и в pandas, они приводятся к float64,
+# чтобы пропуски можно было обозначить NaN.
+def build_panel(all_data, fields=('Adj Close', 'Volume')):
+    tickers = list(all_data)
+    frames = list(all_data.values())
+    fields = list(fields)
+
+    # Календарь: отсортированное объединение всех дат.
+    stamps = [frame.index.values.astype('datetime64[ns]')
+              for frame in frames]
+    calendar = np.unique(np.concatenate(stamps)) if stamps else \
+        np.array([], dtype='datetime64[ns]')
+    complete = all(len(values) == len(calendar) for values in stamps)
+
+    blocks = {}
+    for field in fields:
+        dtypes = {frame[field].dtype for frame in frames}
+        dtype = np.result_type(*dtypes) if dtypes else np.dtype(np.float64)
+        if dtype.kind in 'iub' and complete:
+            blocks[field] = np.empty((len(tickers), len(calendar)), dtype)
+        else:
+            blocks[field] = np.full((len(tickers), len(calendar)), np.nan)
+
+    for i, (frame, values) in enumerate(zip(frames, stamps)):
+        # Все даты календаря в порядке возрастания - строка заполняется
+        # целиком; иначе позиции дат ищутся в календаре:
+        if len(values) == len(calendar) and \
+                frame.index.is_monotonic_increasing:
+            positions = slice(None)
+        else:
+            positions = np.searchsorted(calendar, values)
+        for field in fields:
+            blocks[field][i, positions] = frame[field].to_numpy()
+
+    name = frames[0].index.name if frames else None
+    index = pd.DatetimeIndex(calendar, name=name)
+    columns = pd.Index(tickers)
+    return {field: pd.DataFrame(blocks[field].T, index=index,
+                                columns=columns, copy=False)
+            for field in fields}
+
+
+# Синтетические данные: у каждого тикера своя дата начала торгов и
+# несколько случайно пропущенных дней.
+def make_all_data(n_tickers, years, seed=0):
+    rng = np.random.default_rng(seed)
+    calendar = pd.bdate_range(end='2020-12-31', periods=252 * years,
+                              name='Date')
+    all_data = {}
+    for i in range(n_tickers):
+        start = rng.integers(0, len(calendar) // 2)
+        keep = rng.random(len(calendar) - start) > 0.005
+        index = calendar[start:][keep]
+        all_data[f"T{i:04d}"] = pd.DataFrame({
+            'Adj Close': rng.random(len(index)) * 100,
+            'Volume': rng.integers(10 ** 5, 10 ** 7, len(index)),
+        }, index=index)
+    return all_data
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def build_dict_of_series(all_data):
+    price = pd.DataFrame({ticker: data['Adj Close']
+                          for ticker, data in all_data.items()})
+    volume = pd.DataFrame({ticker: data['Volume']
+                           for ticker, data in all_data.items()})
+    return {'Adj Close': price, 'Volume': volume}
+
+
+def main():
+    # Небольшой пример: у GOOG нет одной даты, поэтому объёмы приводятся
+    # к float64, как и при сборке через словарь рядов:
+    dates = pd.bdate_range('2020-12-24', periods=4, name='Date')
+    all_data = {
+        'AAPL': pd.DataFrame({'Adj Close': [131.9, 136.1, 134.8, 133.5],
+                              'Volume': [54930, 124486, 121047, 96452]},
+                             index=dates),
+        'GOOG': pd.DataFrame({'Adj Close': [1738.8, 1776.1, 1758.7],
+                              'Volume': [346800, 1393000, 1299400]},
+                             index=dates.delete(1)),
+    }
+    panel = build_panel(all_data)
+    print(panel['Adj Close'])
+    #               AAPL    GOOG
+    # Date
+    # 2020-12-24  131.9  1738.8
+    # 2020-12-25  136.1     NaN
+    # 2020-12-28  134.8  1776.1
+    # 2020-12-29  133.5  1758.7
+
+    print(panel['Volume'])
+    #                 AAPL       GOOG
+    # Date
+    # 2020-12-24   54930.0   346800.0
+    # 2020-12-25  124486.0        NaN
+    # 2020-12-28  121047.0  1393000.0
+    # 2020-12-29   96452.0  1299400.0
+
+    separator()
+
+    # Сравним с подходом из ex04-01 на 5000 тикерах за 20 лет. Пиковая
+    # память измеряется модулем tracemalloc (NumPy сообщает ему о своих
+    # выделениях памяти) и не включает память исходного словаря all_data:
+    all_data = make_all_data(5000, 20)
+    expected, elapsed, peak = measure(build_dict_of_series, all_data)
+    print(f"dict of Series: {elapsed:6.2f} с, пик {peak / 2 ** 20:7.1f} МБ")
+    del expected
+    panel, elapsed, peak = measure(build_panel, all_data)
+    print(f"build_panel:    {elapsed:6.2f} с, пик {peak / 2 ** 20:7.1f} МБ")
+    # dict of Series:  27.20 с, пик  1145.5 МБ
+    # build_panel:      4.51 с, пик   533.1 МБ
+
+    # Результаты совпадают:
+    expected = build_dict_of_series(all_data)
+    print(all(panel[field].equals(expected[field]) for field in panel))
+    # True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# Pandas - Чтение и запись данных
+#
+# Блочное вычисление матриц корреляции и ковариации.
+#
+# Методы corr и cov объекта DataFrame из ex04-01 перебирают пары столбцов
+# по одной и для каждой пары отбрасывают строки, где хотя бы одно значение
+# пропущено. Для n тикеров и T дат это O(n²·T) операций в одном потоке.
+#
+# Те же попарные суммы можно получить матричными произведениями. Пусть X -
+# значения с нулями вместо NaN, а M - матрица-маска (1 там, где значение
+# есть). Тогда для пары столбцов i, j:
+#   N   = M.T @ M        - число общих наблюдений;
+#   Sx  = X.T @ M        - сумма x_i по строкам, где есть и x_j;
+#   Qx  = (X*X).T @ M    - сумма квадратов x_i по тем же строкам;
+#   P   = X.T @ X        - сумма произведений x_i·x_j.
+# Отсюда cov = (P - Sx·Sx.T / N) / (N - 1), а дисперсии для корреляции
+# берутся из Qx и Sx по тем же общим строкам - так сохраняется семантика
+# попарного исключения пропусков. Произведения матриц выполняет BLAS,
+# а выходная матрица n×n разбивается на блоки, которые считаются в пуле
+# потоков (NumPy отпускает GIL на время матричного умножения).
+import concurrent.futures
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Параметры:
+#   min_periods  - минимальное число общих наблюдений для пары, как в
+#                  DataFrame.corr и DataFrame.cov;
+#   block        - размер блока (число столбцов) выходной матрицы;
+#   max_workers  - число потоков (None - по числу процессоров);
+#   dtype        - 'float64' или 'float32'; float32 вдвое уменьшает объём
+#                  памяти и ускоряет умножение ценой точности (около 1e-6).
+def blocked_corr(frame, min_periods=1, block=256, max_workers=None,
+                 dtype='float64'):
+    return _blocked(frame, 'corr', min_periods, block, max_workers, dtype)
+
+
+def blocked_cov(frame, min_periods=None, block=256, max_workers=None,
+                dtype='float64'):
+    return _blocked(frame, 'cov', min_periods, block, max_workers, dtype)
+
+
+def _blocked(frame, method, min_periods, block, max_workers, dtype):
+    values = frame.to_numpy(dtype=np.float64, copy=True)
+    mask = ~np.isnan(values)
+    # Сдвиг столбцов на их среднее не меняет ни ковариацию, ни корреляцию,
+    # но уменьшает потерю точности при вычитании больших сумм.
+    counts = mask.sum(axis=0)
+    values[~mask] = 0
+    values -= values.sum(axis=0) / np.maximum(counts, 1)
+    values[~mask] = 0
+
+    x = values.astype(dtype, copy=False)
+    m = mask.astype(dtype)
+    has_nan = not mask.all()
+    n = x.shape[1]
+    result = np.empty((n, n))
+    min_periods = 1 if min_periods is None else min_periods
+
+    def tile(i, j):
+        xi, xj = x[:, i:i + block], x[:, j:j + block]
+        products = (xi.T @ xj).astype(np.float64)
+        if has_nan:
+            mi, mj = m[:, i:i + block], m[:, j:j + block]
+            nobs = (mi.T @ mj).astype(np.float64)
+            sum_i = (xi.T @ mj).astype(np.float64)
+            sum_j = (mi.T @ xj).astype(np.float64)
+        else:
+            nobs = np.full(products.shape, float(len(x)))
+            sum_i = sum_j = np.zeros(products.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (products - sum_i * sum_j / nobs) / (nobs - 1)
+            if method == 'corr':
+                if has_nan:
+                    sq_i = ((xi * xi).T @ mj).astype(np.float64)
+                    sq_j = (mi.T @ (xj * xj)).astype(np.float64)
+                else:
+                    sq_i = (xi * xi).sum(axis=0)[:, None].astype(np.float64)
+                    sq_j = (xj * xj).sum(axis=0)[None, :].astype(np.float64)
+                var_i = sq_i - sum_i * sum_i / nobs
+                var_j = sq_j - sum_j * sum_j / nobs
+                out = cov * (nobs - 1) / np.sqrt(var_i * var_j)
+                out = np.clip(out, -1, 1)
+            else:
+                out = cov
+        out[nobs < min_periods] = np.nan
+        result[i:i + block, j:j + block] = out
+        result[j:j + block, i:i + block] = out.T
+
+    starts = range(0, n, block)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        futures = [pool.submit(tile, i, j)
+                   for i in starts for j in starts if i <= j]
+        for future in futures:
+            future.result()
+    return pd.DataFrame(result, index=frame.columns, columns=frame.columns)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# Синтетические доходности: тикеры начинают торговаться в разные дни,
+# поэтому у столбцов разное число наблюдений.
+def make_returns(n_tickers, periods, seed=0):
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, 0.01, (periods, 1))
+    values = market * rng.uniform(0.5, 1.5, n_tickers) + \
+        rng.normal(0, 0.01, (periods, n_tickers))
+    starts = rng.integers(0, periods // 2, n_tickers)
+    values[np.arange(periods)[:, None] < starts] = np.nan
+    return pd.DataFrame(values,
+                        index=pd.bdate_range(end='2020-12-31',
+                                             periods=periods),
+                        columns=[f"T{i:04d}" for i in range(n_tickers)])
+
+
+def main():
+    # Небольшой пример с пропусками:
+    returns = pd.DataFrame({
+        'AAPL': [0.011, -0.004, np.nan, 0.021, 0.003, -0.012],
+        'IBM': [0.002, 0.006, -0.011, np.nan, 0.004, -0.007],
+        'MSFT': [0.009, -0.001, 0.004, 0.015, np.nan, -0.010],
+    })
+    print(blocked_corr(returns))
+    #           AAPL       IBM      MSFT
+    # AAPL  1.000000  0.571228  0.992032
+    # IBM   0.571228  1.000000  0.225242
+    # MSFT  0.992032  0.225242  1.000000
+
+    print(returns.corr())
+    #           AAPL       IBM      MSFT
+    # AAPL  1.000000  0.571228  0.992032
+    # IBM   0.571228  1.000000  0.225242
+    # MSFT  0.992032  0.225242  1.000000
+
+    separator()
+
+    # Сравним скорость и точность на 1000 тикерах за 10 лет:
+    returns = make_returns(1000, 2520)
+    corr, elapsed = timed(returns.corr)
+    print(f"DataFrame.corr         {elapsed:7.3f} с")
+    for dtype in ['float64', 'float32']:
+        result, elapsed = timed(blocked_corr, returns, dtype=dtype)
+        error = np.nanmax(np.abs(result.values - corr.values))
+        print(f"blocked_corr {dtype}  {elapsed:7.3f} с, "
+              f"макс. отклонение {error:.1e}")
+    cov, elapsed = timed(returns.cov)
+    print(f"DataFrame.cov          {elapsed:7.3f} с")
+    result, elapsed = timed(blocked_cov, returns)
+    error = np.nanmax(np.abs(result.values - cov.values))
+    print(f"blocked_cov float64   {elapsed:7.3f} с, "
+          f"макс. отклонение {error:.1e}")
+    # DataFrame.corr           6.237 с
+    # blocked_corr float64    0.652 с, макс. отклонение 4.4e-15
+    # blocked_corr float32    0.363 с, макс. отклонение 5.5e-07
+    # DataFrame.cov            6.105 с
+    # blocked_cov float64     0.368 с, макс. отклонение 1.1e-18
+
+    # Замеры сделаны на одном процессорном ядре, то есть выигрыш получен
+    # только за счёт BLAS; на нескольких ядрах блоки считаются параллельно.
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Pandas - Чтение и запись данных
+#
+# Пакетный corrwith для множества целевых рядов.
+#
+# В ex04-01 returns.corrwith(returns.IBM) вычисляет корреляции всех
+# столбцов с одним рядом. Если таких рядов (например, биржевых индексов)
+# сотни, то при вызове corrwith в цикле весь returns каждый раз заново
+# центрируется и нормируется.
+#
+# Функция batched_corrwith принимает DataFrame целевых рядов и возвращает
+# матрицу n×k. Левая таблица стандартизуется один раз, а все целевые ряды
+# обрабатываются матричными произведениями с масками пропусков (см. ex04-05),
+# поэтому для каждой пары (столбец, целевой ряд), как и в corrwith,
+# учитываются только строки, где есть оба значения.
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+def _standardize(values):
+    mask = ~np.isnan(values)
+    count = np.maximum(mask.sum(axis=0), 1)
+    values = np.where(mask, values, 0)
+    values -= values.sum(axis=0) / count
+    values[~mask] = 0
+    scale = np.sqrt((values * values).sum(axis=0) / count)
+    scale[scale == 0] = 1
+    return values / scale, mask.astype(np.float64), mask.all()
+
+
+# Строки выравниваются по пересечению индексов, как в Series.corr.
+# min_periods - минимальное число общих наблюдений для пары.
+def batched_corrwith(frame, targets, min_periods=1):
+    if isinstance(targets, pd.Series):
+        targets = targets.to_frame()
+    index = frame.index.intersection(targets.index)
+    x, mx, x_full = _standardize(
+        frame.reindex(index).to_numpy(dtype=np.float64))
+    y, my, y_full = _standardize(
+        targets.reindex(index).to_numpy(dtype=np.float64))
+
+    products = x.T @ y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if x_full and y_full:
+            nobs = np.full(products.shape, float(len(index)))
+            result = products / np.sqrt(np.outer((x * x).sum(axis=0),
+                                                 (y * y).sum(axis=0)))
+        else:
+            nobs = mx.T @ my
+            sum_x = x.T @ my
+            sum_y = mx.T @ y
+            var_x = (x * x).T @ my - sum_x * sum_x / nobs
+            var_y = mx.T @ (y * y) - sum_y * sum_y / nobs
+            result = (products - sum_x * sum_y / nobs) / \
+                np.sqrt(var_x * var_y)
+    result = np.clip(result, -1, 1)
+    result[nobs < max(min_periods, 2)] = np.nan
+    return pd.DataFrame(result, index=frame.columns, columns=targets.columns)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    returns = pd.DataFrame(rng.normal(0, 0.01, (2520, 4)),
+                           index=pd.bdate_range(end='2020-12-31',
+                                                periods=2520),
+                           columns=['AAPL', 'IBM', 'MSFT', 'GOOG'])
+    returns.iloc[:500, 3] = np.nan
+
+    # С одним рядом результат совпадает с corrwith:
+    print(batched_corrwith(returns, returns.IBM))
+    #            IBM
+    # AAPL -0.037296
+    # IBM   1.000000
+    # MSFT  0.020962
+    # GOOG  0.008277
+
+    print(returns.corrwith(returns.IBM))
+    # AAPL   -0.037296
+    # IBM     1.000000
+    # MSFT    0.020962
+    # GOOG    0.008277
+    # dtype: float64
+
+    separator()
+
+    # Корреляции сразу с несколькими рядами:
+    targets = returns[['IBM', 'GOOG']].rename(columns=lambda c: c + ' idx')
+    print(batched_corrwith(returns, targets))
+    #        IBM idx  GOOG idx
+    # AAPL -0.037296  0.029131
+    # IBM   1.000000  0.008277
+    # MSFT  0.020962 -0.026675
+    # GOOG  0.008277  1.000000
+
+    separator()
+
+    # Сравним с циклом вызовов corrwith для 1000 тикеров и 100 целевых
+    # рядов за 10 лет:
+    returns = pd.DataFrame(rng.normal(0, 0.01, (2520, 1000)),
+                           index=pd.bdate_range(end='2020-12-31',
+                                                periods=2520))
+    returns.iloc[:1000, ::3] = np.nan
+    targets = pd.DataFrame(rng.normal(0, 0.01, (2520, 100)),
+                           index=returns.index)
+
+    start = time.perf_counter()
+    expected = pd.concat({name: returns.corrwith(target)
+                          for name, target in targets.items()}, axis=1)
+    print(f"цикл corrwith:     {time.perf_counter() - start:7.3f} с")
+    start = time.perf_counter()
+    result = batched_corrwith(returns, targets)
+    print(f"batched_corrwith:  {time.perf_counter() - start:7.3f} с")
+    print(np.allclose(result, expected, rtol=0, atol=1e-12))
+    # цикл corrwith:      26.839 с
+    # batched_corrwith:    0.190 с
+    # True
+
+
+if __name__ == '__main__':
+    main()
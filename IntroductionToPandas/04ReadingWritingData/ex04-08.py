@@ -0,0 +1,236 @@
+# Pandas - Чтение и запись данных
+#
+# Скользящие попарные корреляции и ковариации.
+#
+# В ex04-01 корреляции считаются по всей выборке. Для скользящего окна
+# (60, 120, 250 дней) pandas предлагает returns.rolling(60).corr(), но
+# пересчитывать каждое окно заново слишком долго при большом числе тикеров.
+#
+# Для каждой пары тикеров (i, j) будем хранить суммы по текущему окну:
+#   nobs - число строк, где есть и x_i, и x_j;
+#   sx   - сумма x_i по этим строкам (sx.T - сумма x_j);
+#   sxx  - сумма квадратов x_i по этим строкам;
+#   sxy  - сумма произведений x_i·x_j.
+# При сдвиге окна на один день суммы увеличиваются на вклад входящей строки
+# и уменьшаются на вклад выходящей - это O(1) операций на пару, то есть
+# O(n²) на шаг независимо от длины окна. Ошибки округления от прибавления и
+# вычитания накапливаются, поэтому раз в window шагов суммы вычисляются
+# заново по строкам окна (в среднем это тоже O(n²) на шаг).
+import collections
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Параметры такие же, как у DataFrame.rolling: window - длина окна,
+# min_periods - минимальное число общих наблюдений пары (по умолчанию
+# равно window). shift - значения, вычитаемые из каждого столбца: сдвиг не
+# меняет ни ковариацию, ни корреляцию, но уменьшает ошибки округления при
+# вычитании сумм (обычно это средние значения столбцов).
+#
+# Вклад входящей строки a и выходящей строки b в сумму произведений равен
+# outer(a, a) - outer(b, b); такое обновление ранга 2 выполняется одним
+# матричным произведением (n×2)·(2×n). Если в окне нет пропусков, то
+# nobs, sx и sxx одинаковы для всех пар и результат вычисляется по
+# векторам сумм, без лишних матричных операций.
+#
+# Сумма квадратов отклонений sxx - sx²/nobs, меньшая eps·sxx, - это ошибка
+# округления: столбец в окне постоянен, его дисперсия равна 0. Ковариация с
+# ним равна 0, корреляция не определена (NaN).
+class RollingCoMoments:
+    eps = 1e-10
+
+    def __init__(self, columns, window, min_periods=None, shift=None):
+        self.columns = pd.Index(columns)
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        n = len(self.columns)
+        self.shift = np.zeros(n) if shift is None else np.asarray(shift)
+        self.rows = collections.deque()
+        self.nan_rows = 0
+        self.steps = 0
+        self.nobs = np.zeros((n, n))
+        self.sx = np.zeros((n, n))
+        self.sxx = np.zeros((n, n))
+        self.sxy = np.zeros((n, n))
+        self._buffer = np.empty((n, n))
+
+    def push(self, row):
+        x = np.asarray(row, dtype=np.float64) - self.shift
+        valid = ~np.isnan(x)
+        x = np.where(valid, x, 0)
+        v = valid.astype(np.float64)
+        zero = np.zeros_like(x)
+        x_out, v_out, nan_out = zero, zero, False
+        self.rows.append((x, v, not valid.all()))
+        if len(self.rows) > self.window:
+            x_out, v_out, nan_out = self.rows.popleft()
+        self.nan_rows += (not valid.all()) - nan_out
+
+        for total, a_in, b_in, a_out, b_out in [
+            (self.nobs, v, v, v_out, v_out),
+            (self.sx, x, v, x_out, v_out),
+            (self.sxx, x * x, v, x_out * x_out, v_out),
+            (self.sxy, x, x, x_out, x_out),
+        ]:
+            np.matmul(np.stack([a_in, -a_out], axis=1),
+                      np.stack([b_in, b_out]), out=self._buffer)
+            total += self._buffer
+        self.steps += 1
+        if self.steps >= self.window:
+            self._recompute()
+        return self
+
+    # Суммы по строкам текущего окна без накопленных ошибок округления.
+    def _recompute(self):
+        x, v, nan = (np.array(column) for column in zip(*self.rows))
+        self.nobs = v.T @ v
+        self.sx = x.T @ v
+        self.sxx = (x * x).T @ v
+        self.sxy = x.T @ x
+        self.nan_rows = int(nan.sum())
+        self.steps = 0
+
+    def cov(self):
+        nobs, sx, sy, dxx = self._moments()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (self.sxy - sx * sy / nobs) / (nobs - 1)
+        result[(dxx == 0) | (dxx.T == 0)] = 0
+        return self._mask(result)
+
+    def corr(self):
+        nobs, sx, sy, dxx = self._moments()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (self.sxy - sx * sy / nobs) / np.sqrt(dxx * dxx.T)
+        result[(dxx == 0) | (dxx.T == 0)] = np.nan
+        return self._mask(np.clip(result, -1, 1))
+
+    # Суммы и суммы квадратов отклонений dxx = sxx - sx²/nobs (для y это
+    # dxx.T); значения меньше eps·sxx заменяются нулём.
+    def _moments(self):
+        nobs, sx, sy, sxx, _ = self._sums()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dxx = sxx - sx * sx / nobs
+        dxx[dxx <= self.eps * sxx] = 0
+        return nobs, sx, sy, dxx
+
+    def _sums(self):
+        if self.nan_rows:
+            return (self.nobs, self.sx, self.sx.T, self.sxx, self.sxx.T)
+        sx = self.sx[:, :1]
+        sxx = self.sxx[:, :1]
+        return self.nobs[0, 0], sx, sx.T, sxx, sxx.T
+
+    def _mask(self, result):
+        if self.nan_rows or self.nobs[0, 0] < self.min_periods:
+            result[(self.nobs < self.min_periods) | (self.nobs < 1)] = np.nan
+        return result
+
+
+# Потоковый режим с ограниченной памятью: генератор выдаёт пары
+# (метка строки, матрица n×n) и хранит только последнюю матрицу и строки
+# текущего окна.
+def iter_rolling(frame, window, method='corr', min_periods=None):
+    state = RollingCoMoments(frame.columns, window, min_periods,
+                             shift=frame.mean().fillna(0).to_numpy())
+    for label, row in zip(frame.index, frame.to_numpy(dtype=np.float64)):
+        state.push(row)
+        yield label, getattr(state, method)()
+
+
+# Полный результат в виде массива формы (T, n, n).
+def rolling_pairwise(frame, window, method='corr', min_periods=None):
+    result = np.empty((len(frame), frame.shape[1], frame.shape[1]))
+    for i, (_, matrix) in enumerate(iter_rolling(frame, window, method,
+                                                 min_periods)):
+        result[i] = matrix
+    return result
+
+
+# Тот же результат в формате frame.rolling(window).corr(): строки с
+# MultiIndex (дата, тикер), столбцы - тикеры.
+def rolling_corr(frame, window, min_periods=None):
+    return _to_frame(frame, rolling_pairwise(frame, window, 'corr',
+                                             min_periods))
+
+
+def rolling_cov(frame, window, min_periods=None):
+    return _to_frame(frame, rolling_pairwise(frame, window, 'cov',
+                                             min_periods))
+
+
+def _to_frame(frame, result):
+    index = pd.MultiIndex.from_product([frame.index, frame.columns])
+    return pd.DataFrame(result.reshape(-1, frame.shape[1]), index=index,
+                        columns=frame.columns)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    returns = pd.DataFrame(rng.normal(0, 0.01, (500, 3)),
+                           index=pd.bdate_range(end='2020-12-31',
+                                                periods=500),
+                           columns=['AAPL', 'IBM', 'MSFT'])
+    returns.iloc[100:110, 1] = np.nan
+
+    result = rolling_corr(returns, 60)
+    print(result.tail(3))
+    #                      AAPL       IBM      MSFT
+    # 2020-12-31 AAPL  1.000000 -0.262782 -0.079672
+    #            IBM  -0.262782  1.000000  0.073466
+    #            MSFT -0.079672  0.073466  1.000000
+
+    # Результат совпадает с returns.rolling(60).corr():
+    print(np.allclose(result, returns.rolling(60).corr(), rtol=0,
+                      atol=1e-10, equal_nan=True),
+          np.allclose(rolling_cov(returns, 60), returns.rolling(60).cov(),
+                      rtol=0, atol=1e-15, equal_nan=True))
+    # True True
+
+    separator()
+
+    # В потоковом режиме в памяти хранится только последняя матрица.
+    # Последняя корреляция MSFT и IBM для окон в 60, 120 и 250 дней:
+    for window in [60, 120, 250]:
+        for label, matrix in iter_rolling(returns, window):
+            pass
+        print(f"{window:>3} дней: {matrix[2, 1]: .6f}")
+    #  60 дней:  0.073466
+    # 120 дней:  0.077364
+    # 250 дней: -0.013164
+
+    separator()
+
+    # Сравним скорость с returns.rolling(250).corr() для 100 тикеров
+    # за 10 лет:
+    returns = pd.DataFrame(rng.normal(0, 0.01, (2520, 100)))
+    start = time.perf_counter()
+    expected = returns.rolling(250).corr()
+    print(f"rolling(250).corr(): {time.perf_counter() - start:7.3f} с")
+    start = time.perf_counter()
+    result = rolling_corr(returns, 250)
+    print(f"rolling_corr():      {time.perf_counter() - start:7.3f} с")
+    print(np.allclose(result, expected, rtol=0, atol=1e-10,
+                      equal_nan=True))
+    # rolling(250).corr():   7.032 с
+    # rolling_corr():        1.241 с
+    # True
+
+
+if __name__ == '__main__':
+    main()
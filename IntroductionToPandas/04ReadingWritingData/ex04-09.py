@@ -0,0 +1,131 @@
+# Pandas - Чтение и запись данных
+#
+# Ковариация по истории, которая не помещается в память.
+#
+# В ex04-01 для вызова returns.cov() вся таблица price должна находиться в
+# памяти. Функция read_csv с аргументом chunksize позволяет читать файл
+# частями (по chunksize строк). Чтобы процентные изменения на границе
+# частей вычислялись правильно, последняя строка предыдущей части
+# переносится в начало следующей. Доходности каждой части добавляются в
+# состояние CoMoments из ex04-06, поэтому в памяти одновременно находятся
+# только одна часть таблицы и матрицы состояния размера n×n.
+import importlib
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Генератор доходностей по частям таблицы цен. Результат совпадает с
+# price.pct_change(fill_method=None) - поведением по умолчанию в новых
+# версиях pandas (пропуск в цене даёт пропуск в доходности). Таблицы,
+# прочитанные read_csv по частям, хранят каждый столбец отдельным блоком,
+# поэтому деление выполняется сразу над массивом NumPy всей части.
+def iter_returns(chunks, periods=1):
+    carry = None
+    for chunk in chunks:
+        values = chunk.to_numpy(dtype=np.float64)
+        if carry is None:
+            carry = np.full((periods, values.shape[1]), np.nan)
+        values = np.concatenate([carry, values])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = values[periods:] / values[:-periods] - 1
+        carry = values[-periods:]
+        yield pd.DataFrame(returns, index=chunk.index, columns=chunk.columns)
+
+
+# Состояние CoMoments, накопленное по частям. Источник - путь к файлу CSV
+# (читается с помощью read_csv по chunksize строк) или любая
+# последовательность таблиц DataFrame.
+def chunked_comoments(source, chunksize=100_000):
+    comoments = importlib.import_module('ex04-06').CoMoments
+    if isinstance(source, (str, os.PathLike)):
+        source = pd.read_csv(source, index_col=0, parse_dates=True,
+                             chunksize=chunksize)
+    state = None
+    for returns in iter_returns(source):
+        if state is None:
+            state = comoments(returns.columns)
+        state.update(returns)
+    return state
+
+
+def main():
+    # Запишем на диск цены 500 тикеров за 20 лет. У части тикеров история
+    # начинается позже, а в ценах встречаются пропуски:
+    rng = np.random.default_rng(0)
+    values = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (5040, 500)),
+                                    axis=0))
+    values[np.arange(5040)[:, None] < rng.integers(0, 2520, 500)] = np.nan
+    values[rng.random(values.shape) < 0.001] = np.nan
+    price = pd.DataFrame(values,
+                         index=pd.bdate_range(end='2020-12-31', periods=5040),
+                         columns=[f"T{i:03d}" for i in range(500)])
+    path = os.path.join(tempfile.mkdtemp(), 'price.csv')
+    price.to_csv(path)
+    del price, values
+
+    # Обычный способ: прочитать всё и вызвать cov().
+    def read_all():
+        price = pd.read_csv(path, index_col=0, parse_dates=True)
+        return price.pct_change(fill_method=None).cov()
+
+    # По частям из 250 строк:
+    def read_chunked():
+        return chunked_comoments(path, chunksize=250).cov()
+
+    for name, func in [('read_csv + cov()', read_all),
+                       ('chunked_comoments', read_chunked)]:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:<18} {elapsed:6.2f} с, пик {peak / 2 ** 20:6.1f} МБ")
+    # read_csv + cov()     3.33 с, пик   79.4 МБ
+    # chunked_comoments    1.54 с, пик   30.4 МБ
+
+    # Пиковая память при чтении по частям определяется размером части и
+    # матрицами состояния n×n и не растёт с длиной истории.
+
+    expected = read_all()
+    print(np.allclose(result, expected, rtol=0, atol=1e-15, equal_nan=True))
+    # True
+
+    separator()
+
+    # Из состояния можно получить и корреляции, как в ex04-01:
+    state = chunked_comoments(path, chunksize=250)
+    print(state.corrwith('T001').head())
+    # T000   -0.005494
+    # T001    1.000000
+    # T002   -0.015145
+    # T003    0.020730
+    # T004   -0.006253
+    # dtype: float64
+
+    shutil.rmtree(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
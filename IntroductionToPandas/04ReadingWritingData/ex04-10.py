@@ -0,0 +1,255 @@
+# Pandas - Чтение и запись данных
+#
+# Асинхронный конвейер: загрузка и вычисления одновременно.
+#
+# В ex04-01 вычисление pct_change() и corr() начинается только после того,
+# как загружены все тикеры: пока идёт загрузка, процессор простаивает, а
+# пока идут вычисления - простаивает сеть.
+#
+# Построим конвейер на asyncio. Загрузчики (производители) кладут таблицу
+# каждого тикера в очередь asyncio.Queue, как только она получена, а
+# обработчик (потребитель) сразу вычисляет доходности этого тикера и
+# добавляет их к накопленным суммам для корреляций. Доходности, как в
+# ex04-01, считаются по объединённому календарю всех тикеров: если у тикера
+# нет цены на какую-то дату, доходность за эту и следующую дату - NaN, а не
+# изменение цены через пропуск.
+#
+# Очередь ограничена по размеру: если данные приходят быстрее, чем
+# обрабатываются, загрузчики ждут освобождения места, и в памяти
+# одновременно находится не более queue_size необработанных таблиц.
+import asyncio
+import concurrent.futures
+import importlib
+import time
+
+import pandas as pd
+import numpy as np
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Корреляции, которые пополняются по столбцам
+#
+# В отличие от CoMoments из ex04-06, где добавляются строки (новые дни),
+# здесь по одному добавляются столбцы (новые тикеры). При добавлении
+# тикера y его попарные суммы со всеми уже добавленными тикерами
+# вычисляются матричными произведениями с масками пропусков (см. ex04-05):
+# это одна новая строка и один новый столбец матриц сумм. Каждый столбец
+# перед сохранением сдвигается на своё среднее - это не меняет ни
+# ковариацию, ни корреляцию, но уменьшает ошибки округления.
+#
+# С returns=True добавляются цены, а в суммы входят их доходности
+# pct_change(fill_method=None) на объединённом индексе. Если новый тикер
+# добавляет даты, доходности уже добавленных тикеров за следующие за ними
+# даты становятся NaN, и суммы для них пересчитываются заново.
+class IncrementalCorr:
+    def __init__(self, returns=False):
+        self.returns = returns
+        self.index = pd.DatetimeIndex([])
+        self.columns = []
+        self.values = np.empty((0, 0))
+        self.mask = np.empty((0, 0))
+        self.nobs = np.empty((0, 0))
+        self.sums = np.empty((0, 0))
+        self.squares = np.empty((0, 0))
+        self.products = np.empty((0, 0))
+
+    def add(self, name, series):
+        if not series.index.isin(self.index).all():
+            self._reindex(self.index.union(series.index))
+        k = len(self.columns)
+        if k == self.values.shape[1]:
+            self._grow(max(2 * k, 16))
+
+        y = np.full(len(self.index), np.nan)
+        y[self.index.get_indexer(series.index)] = series.to_numpy()
+        if self.returns:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                y = np.concatenate([[np.nan], y[1:] / y[:-1] - 1])
+        valid = ~np.isnan(y)
+        if valid.any():
+            y -= y[valid].mean()
+        y = np.where(valid, y, 0)
+        m = valid.astype(np.float64)
+        self.values[:, k] = y
+        self.mask[:, k] = m
+        self.columns.append(name)
+
+        x, mx = self.values[:, :k + 1], self.mask[:, :k + 1]
+        self.nobs[:k + 1, k] = self.nobs[k, :k + 1] = mx.T @ m
+        self.sums[:k + 1, k] = x.T @ m
+        self.sums[k, :k + 1] = mx.T @ y
+        self.squares[:k + 1, k] = (x * x).T @ m
+        self.squares[k, :k + 1] = mx.T @ (y * y)
+        self.products[:k + 1, k] = self.products[k, :k + 1] = x.T @ y
+        return self
+
+    def cov(self, min_periods=None):
+        nobs, sx, _, sxy = self._state()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = (sxy - sx * sx.T / nobs) / (nobs - 1)
+        min_periods = 1 if min_periods is None else min_periods
+        result[(nobs < min_periods) | (nobs < 2)] = np.nan
+        return pd.DataFrame(result, index=self.columns, columns=self.columns)
+
+    def corr(self, min_periods=1):
+        nobs, sx, sxx, sxy = self._state()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = sxx - sx * sx / nobs
+            result = np.clip((sxy - sx * sx.T / nobs) /
+                             np.sqrt(var * var.T), -1, 1)
+        result[nobs < min_periods] = np.nan
+        return pd.DataFrame(result, index=self.columns, columns=self.columns)
+
+    def _state(self):
+        k = len(self.columns)
+        return (self.nobs[:k, :k], self.sums[:k, :k], self.squares[:k, :k],
+                self.products[:k, :k])
+
+    def _reindex(self, index):
+        positions = index.get_indexer(self.index)
+        for name in ['values', 'mask']:
+            old = getattr(self, name)
+            new = np.zeros((len(index), old.shape[1]))
+            new[positions] = old
+            setattr(self, name, new)
+        self.index = index
+        if self.returns:
+            # Доходности за даты сразу после новых дат:
+            added = np.ones(len(index), dtype=bool)
+            added[positions] = False
+            after = np.zeros(len(index), dtype=bool)
+            after[1:] = added[:-1] & ~added[1:]
+            if self.mask[after].any():
+                self.values[after] = 0
+                self.mask[after] = 0
+                self._recompute()
+
+    # Суммы всех пар по сохранённым столбцам.
+    def _recompute(self):
+        k = len(self.columns)
+        x, m = self.values[:, :k], self.mask[:, :k]
+        self.nobs[:k, :k] = m.T @ m
+        self.sums[:k, :k] = x.T @ m
+        self.squares[:k, :k] = (x * x).T @ m
+        self.products[:k, :k] = x.T @ x
+
+    def _grow(self, capacity):
+        for name in ['values', 'mask']:
+            old = getattr(self, name)
+            new = np.zeros((old.shape[0], capacity))
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+        for name in ['nobs', 'sums', 'squares', 'products']:
+            old = getattr(self, name)
+            new = np.zeros((capacity, capacity))
+            new[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, new)
+
+
+# Конвейер
+#
+# Параметры fetch, max_workers и timeout такие же, как у load_all из
+# ex04-02; queue_size - размер очереди между загрузкой и вычислениями;
+# field - столбец с ценой. Вычисления выполняются в отдельном потоке, чтобы
+# не останавливать цикл событий (NumPy при этом отпускает GIL, и загрузка
+# продолжается). Возвращает объект IncrementalCorr и статистику: наибольшее
+# число таблиц, ожидавших в очереди.
+async def ingest(tickers, fetch, max_workers=8, queue_size=16, timeout=30,
+                 field='Adj Close'):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(queue_size)
+    semaphore = asyncio.Semaphore(max_workers)
+    io_pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+    cpu_pool = concurrent.futures.ThreadPoolExecutor(1)
+    state = IncrementalCorr(returns=True)
+    stats = {'max_queue': 0}
+
+    def process(ticker, frame):
+        state.add(ticker, frame[field])
+
+    async def produce(ticker):
+        async with semaphore:
+            call = loop.run_in_executor(
+                io_pool, lambda: fetch(ticker, timeout=timeout))
+            frame = await asyncio.wait_for(call, timeout)
+        await queue.put((ticker, frame))
+        stats['max_queue'] = max(stats['max_queue'], queue.qsize())
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            await loop.run_in_executor(cpu_pool, process, *item)
+
+    consumer = asyncio.create_task(consume())
+    try:
+        await asyncio.gather(*(produce(ticker) for ticker in tickers))
+        await queue.put(None)
+        await consumer
+    finally:
+        consumer.cancel()
+        io_pool.shutdown(wait=False)
+        cpu_pool.shutdown(wait=False)
+    return state, stats
+
+
+def main():
+    quotes = importlib.import_module('ex04-02')
+    server = quotes.start_quote_server(delay=0.2, periods=2520)
+    fetch_all = quotes.quote_fetcher(server.url)
+    tickers = [f"T{i:04d}" for i in range(400)]
+
+    # У одного тикера нет котировок за 6 дней внутри периода:
+    def fetch(ticker, timeout=None):
+        data = fetch_all(ticker, timeout=timeout)
+        return data.drop(data.index[1000:1006]) if ticker == 'T0007' \
+            else data
+
+    # Первый запрос заполняет кэш ответов сервера, поэтому в замерах
+    # участвуют только задержка сети и обработка на стороне клиента:
+    quotes.load_all(tickers, fetch, max_workers=16)
+
+    # Последовательная схема из ex04-01: сначала загрузка, потом расчёт.
+    start = time.perf_counter()
+    all_data = quotes.load_all(tickers, fetch, max_workers=16)
+    price = pd.DataFrame({ticker: data['Adj Close']
+                          for ticker, data in all_data.items()})
+    expected = price.pct_change(fill_method=None).corr()
+    print(f"загрузка, затем corr(): {time.perf_counter() - start:6.2f} с")
+
+    # Конвейер:
+    start = time.perf_counter()
+    state, stats = asyncio.run(ingest(tickers, fetch, max_workers=16,
+                                      queue_size=8))
+    result = state.corr().loc[tickers, tickers]
+    print(f"конвейер:               {time.perf_counter() - start:6.2f} с")
+    print(f"наибольшая длина очереди: {stats['max_queue']}")
+    # загрузка, затем corr():  10.46 с
+    # конвейер:                 8.95 с
+    # наибольшая длина очереди: 8
+
+    # Очередь заполнялась до предела: на одном процессорном ядре вычисления
+    # не успевают за загрузкой, и ограничение очереди сдерживает загрузчики.
+
+    print(np.allclose(result, expected, rtol=0, atol=1e-12))
+    # True
+
+    quotes.stop_quote_server(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# Pandas - Чтение и запись данных
+#
+# Пул соединений и ограничение частоты запросов для pandas_datareader.
+#
+# В ex04-01 каждый вызов web.get_data_yahoo открывает новое соединение
+# (с установкой TCP и TLS), ничего не повторяет при ошибках и не
+# ограничивает частоту запросов, поэтому при загрузке пачкой сервер
+# начинает отвечать ошибкой 429 Too Many Requests.
+#
+# Функции pandas_datareader принимают аргумент session - объект
+# requests.Session. Создадим его наследника, который:
+#   - держит пул постоянных (keep-alive) соединений, общий для всех потоков;
+#   - ограничивает частоту запросов алгоритмом «ведро с токенами»;
+#   - повторяет запрос при ответах 429 и 5xx и при сетевых ошибках с
+#     экспоненциально растущей паузой со случайной составляющей (jitter);
+#   - записывает время выполнения каждого запроса.
+import datetime
+import email.utils
+import importlib
+import io
+import random
+import threading
+import time
+
+import pandas as pd
+import numpy as np
+# import pandas_datareader.data as web
+import pandas_datareader as web
+import requests
+
+
+def separator():
+    print('-' * 70)
+
+
+def arr_info(name, arr):
+    print(
+        f"Массив {name}:",
+        type(arr),
+        id(arr),
+        arr.shape
+        # arr.dtype
+    )
+
+
+# Ведро с токенами: в секунду добавляется rate токенов, но не больше burst.
+# Каждый запрос забирает один токен или ждёт, пока токен появится.
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Значение заголовка Retry-After в секундах: число секунд или дата HTTP
+# (RFC 9110), например "Wed, 21 Oct 2015 07:28:00 GMT". Непонятное
+# значение не учитывается (0).
+def _retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+# Параметры:
+#   rate, burst  - средняя частота запросов в секунду и допустимый всплеск;
+#   pool_size    - число постоянных соединений с одним сервером;
+#   max_retries  - число повторов после первой неудачной попытки;
+#   backoff      - пауза перед первым повтором в секундах; далее она
+#                  удваивается, но не превышает max_backoff. Фактическая
+#                  пауза выбирается случайно от backoff/2 до backoff, чтобы
+#                  повторы от разных потоков не приходили одновременно.
+#                  Если сервер прислал заголовок Retry-After, ждём не
+#                  меньше указанного времени.
+class RateLimitedSession(requests.Session):
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, rate=10, burst=10, pool_size=16, max_retries=5,
+                 backoff=0.5, max_backoff=30):
+        super().__init__()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.records = []
+        self.records_lock = threading.Lock()
+
+    def request(self, method, url, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+                status, error = response.status_code, None
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                response, status, error = None, None, exc
+            self._record(url, status, attempt, time.perf_counter() - start)
+            if error is None and status not in self.retry_statuses:
+                return response
+            if attempt == self.max_retries:
+                break
+            time.sleep(self._pause(attempt, response))
+        if error is not None:
+            raise error
+        return response
+
+    def _pause(self, attempt, response):
+        pause = min(self.max_backoff, self.backoff * 2 ** attempt)
+        pause = random.uniform(pause / 2, pause)
+        if response is not None and 'Retry-After' in response.headers:
+            pause = max(pause, _retry_after(response.headers['Retry-After']))
+        return pause
+
+    def _record(self, url, status, attempt, latency):
+        with self.records_lock:
+            self.records.append((url, status, attempt, latency))
+
+    # Статистика запросов в виде DataFrame: адрес, код ответа, номер
+    # попытки и время выполнения в секундах.
+    def metrics(self):
+        with self.records_lock:
+            return pd.DataFrame(self.records,
+                                columns=['url', 'status', 'attempt',
+                                         'latency'])
+
+
+def yahoo_fetcher(session):
+    def fetch(ticker, timeout=30):
+        return web.get_data_yahoo(ticker, session=session, timeout=timeout)
+    return fetch
+
+
+# Загрузка с локального сервера котировок через сессию.
+def session_fetcher(session, base_url):
+    def fetch(ticker, timeout=None):
+        response = session.get(f"{base_url}/quote",
+                               params={'ticker': ticker}, timeout=timeout)
+        response.raise_for_status()
+        return pd.read_csv(io.BytesIO(response.content), index_col='Date',
+                           parse_dates=True)
+    return fetch
+
+
+# Сервер котировок из ex04-02, который иногда отвечает 429 или отвечает
+# медленно. Он также считает открытые клиентами соединения.
+def flaky_handler(quotes):
+    class FlakyQuoteHandler(quotes.QuoteHandler):
+        def setup(self):
+            super().setup()
+            with self.server.lock:
+                self.server.connections += 1
+
+        def do_GET(self):
+            rng = self.server.rng
+            if rng.random() < self.server.error_rate:
+                self.send_response(429)
+                self.send_header('Retry-After', '0.1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if rng.random() < self.server.slow_rate:
+                time.sleep(self.server.slow_delay)
+            super().do_GET()
+
+    return FlakyQuoteHandler
+
+
+def start_flaky_server(quotes, error_rate=0.2, slow_rate=0.05,
+                       slow_delay=0.5, **kwargs):
+    server = quotes.start_quote_server(handler=flaky_handler(quotes),
+                                       **kwargs)
+    server.rng = np.random.default_rng(0)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.error_rate = error_rate
+    server.slow_rate = slow_rate
+    server.slow_delay = slow_delay
+    return server
+
+
+def main():
+    quotes = importlib.import_module('ex04-02')
+    server = start_flaky_server(quotes, error_rate=0, slow_rate=0,
+                                delay=0.02, periods=250)
+    tickers = [f"T{i:04d}" for i in range(200)]
+    # Заполним кэш ответов сервера, затем включим ошибки и медленные ответы:
+    quotes.load_all(tickers, quotes.quote_fetcher(server.url), max_workers=16)
+    server.connections = 0
+    server.error_rate = 0.2
+    server.slow_rate = 0.05
+
+    # Без сессии: каждый запрос открывает новое соединение, а ответы 429
+    # превращаются в ошибки:
+    start = time.perf_counter()
+    all_data = quotes.load_all(tickers, quotes.quote_fetcher(server.url),
+                               max_workers=16, errors='ignore')
+    print(f"urlopen: {time.perf_counter() - start:.2f} с, "
+          f"загружено {len(all_data)} из {len(tickers)}, "
+          f"соединений {server.connections}")
+    # urlopen: 1.16 с, загружено 152 из 200, соединений 200
+
+    separator()
+
+    # С сессией: не более 100 запросов в секунду, повторы при ошибках и
+    # 16 постоянных соединений:
+    server.connections = 0
+    session = RateLimitedSession(rate=100, burst=20, pool_size=16,
+                                 backoff=0.1)
+    start = time.perf_counter()
+    all_data = quotes.load_all(tickers, session_fetcher(session, server.url),
+                               max_workers=16)
+    print(f"session: {time.perf_counter() - start:.2f} с, "
+          f"загружено {len(all_data)} из {len(tickers)}, "
+          f"соединений {server.connections}")
+    # session: 2.77 с, загружено 200 из 200, соединений 14
+
+    # Статистика запросов:
+    metrics = session.metrics()
+    print(metrics['status'].value_counts())
+    # status
+    # 200    200
+    # 429     48
+    # Name: count, dtype: int64
+
+    print(metrics['latency'].describe(percentiles=[0.5, 0.95, 0.99]))
+    # count    248.000000
+    # mean       0.083628
+    # std        0.129635
+    # min        0.001881
+    # 50%        0.065694
+    # 95%        0.563958
+    # 99%        0.570708
+    # max        0.597586
+    # Name: latency, dtype: float64
+
+    # Сессия медленнее, потому что ждёт перед повторами, зато загружает
+    # все тикеры и открывает не больше pool_size соединений. Ошибки и
+    # медленные ответы выбираются случайно, поэтому числа меняются от
+    # запуска к запуску.
+
+    quotes.stop_quote_server(server)
+
+    # С Yahoo Finance сессия передаётся в pandas_datareader:
+    # session = RateLimitedSession(rate=2, burst=5)
+    # all_data = quotes.load_all(['AAPL', 'IBM', 'MSFT', 'GOOG'],
+    #                            yahoo_fetcher(session), max_workers=4)
+
+
+if __name__ == '__main__':
+    main()